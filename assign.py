@@ -3,91 +3,192 @@ Hierarchical assignment (parent then child) adapted from the notebook.
 """
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from utils import split_any
+from tax_tree import PathTree
 import config
 
+# float32 similarity block + parent-grouped copy + masked copy + boolean masks, per cell
+_BYTES_PER_CELL = 16
 
-def assign_hierarchical(em, id_col, tax_paths, em_emb, tax_emb):
-    S = cosine_similarity(em_emb, tax_emb)
-
-    # Build parent -> taxonomy row indices
-    tax_parents = []
-    for p in tax_paths:
-        parts = split_any(p)
-        parent = parts[0] if parts else "UNCAT"
-        tax_parents.append(parent)
-
-    parent_to_idx = {}
-    for j, p in enumerate(tax_parents):
-        parent_to_idx.setdefault(p, []).append(j)
-
-    rows = []
-    for i, inc_id in enumerate(em[id_col].tolist()):
-        sims = S[i]
-
-        parent_scores = {p: float(np.max(sims[idxs])) for p, idxs in parent_to_idx.items()}
-        parent_ranked = sorted(parent_scores.items(), key=lambda x: x[1], reverse=True)
-
-        best_parent, best_parent_sim = parent_ranked[0]
-        second_parent_sim = parent_ranked[1][1] if len(parent_ranked) > 1 else -1.0
-        parent_margin = best_parent_sim - second_parent_sim
-        parent_low_conf = (parent_margin < config.PARENT_MARGIN)
-
-        if best_parent_sim < config.PARENT_MIN_SIM:
-            rows.append({
-                "Accident ID": inc_id,
-                "Final_Category_Path": "UNCAT",
-                "Cosine": best_parent_sim,
-                "Rank": 1,
-                "Selected": True,
-                "Below_UNCAT_Threshold": True,
-                "Parent": "UNCAT",
-                "Parent_Sim": best_parent_sim,
-                "Parent_Margin": parent_margin,
-                "Parent_LowConf": True
-            })
-            continue
-
-        # child selection within best parent
-        idxs = parent_to_idx[best_parent]
-        idxs_sorted = sorted(idxs, key=lambda j: sims[j], reverse=True)
-
-        child_best = float(sims[idxs_sorted[0]])
-        selected = []
-        for j in idxs_sorted:
-            if len(selected) >= config.TOPK_CHILD:
-                break
-            if sims[j] >= config.CHILD_MIN_SIM or (child_best - sims[j] <= config.CHILD_MARGIN):
-                selected.append(j)
-
-        if not selected:
-            rows.append({
-                "Accident ID": inc_id,
-                "Final_Category_Path": f"{best_parent} > OTHER",
-                "Cosine": best_parent_sim,
-                "Rank": 1,
-                "Selected": True,
-                "Below_UNCAT_Threshold": False,
-                "Parent": best_parent,
-                "Parent_Sim": best_parent_sim,
-                "Parent_Margin": parent_margin,
-                "Parent_LowConf": parent_low_conf
-            })
-        else:
-            for rank, j in enumerate(selected, start=1):
-                rows.append({
-                    "Accident ID": inc_id,
-                    "Final_Category_Path": tax_paths[j],
-                    "Cosine": float(sims[j]),
-                    "Rank": rank,
-                    "Selected": True,
-                    "Below_UNCAT_Threshold": False,
-                    "Parent": best_parent,
-                    "Parent_Sim": best_parent_sim,
-                    "Parent_Margin": parent_margin,
-                    "Parent_LowConf": parent_low_conf
-                })
-
-    assign_raw = pd.DataFrame(rows)
-    return assign_raw
+ASSIGN_COLUMNS = ["Accident ID", "Final_Category_Path", "Cosine", "Rank", "Selected", "Below_UNCAT_Threshold",
+                  "Parent", "Parent_Sim", "Parent_Margin", "Parent_LowConf"]
+
+
+def parent_groups(tax_paths, tree=None):
+    """Return (parent names in first-seen order, parent code per taxonomy column)."""
+    tree = PathTree() if tree is None else tree
+    # factorize keeps first-seen order
+    codes, names = pd.factorize(pd.Series(tree.root_labels(tree.ids(tax_paths), "UNCAT"), dtype=object), use_na_sentinel=False)
+    return list(names), codes.astype(np.int64)
+
+
+def _parent_maxima(S, codes, n_parents):
+    """Per-parent max similarity for every row: columns grouped by parent, then a segment max."""
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(n_parents))
+    return np.maximum.reduceat(S[:, order], starts, axis=1)
+
+
+def topk_columns(S, k):
+    """Top-k columns of each row of S (-inf entries are skipped), ties broken by column index."""
+    n, m = S.shape
+    k = int(max(0, min(k, m)))
+    child_idx = np.full((n, k), -1, dtype=np.int64)
+    child_sim = np.full((n, k), -np.inf, dtype=S.dtype)
+    if n == 0 or k == 0:
+        return child_idx, child_sim
+    kth = np.partition(S, m - k, axis=1)[:, m - k]
+    # candidates are every column reaching the k-th value (more than k only on ties)
+    rr, cc = np.nonzero((S >= kth[:, None]) & np.isfinite(S))
+    vals = S[rr, cc]
+    o = np.lexsort((cc, -vals, rr))
+    rr, cc, vals = rr[o], cc[o], vals[o]
+    pos = np.arange(len(rr)) - np.searchsorted(rr, rr)
+    keep = pos < k
+    child_idx[rr[keep], pos[keep]] = cc[keep]
+    child_sim[rr[keep], pos[keep]] = vals[keep]
+    return child_idx, child_sim
+
+
+def _top_children(S, codes, best_parent, k):
+    """Top-k columns of each row restricted to its best parent."""
+    return topk_columns(np.where(codes[None, :] == best_parent[:, None], S, -np.inf), k)
+
+
+def score_parents_children(S, codes, n_parents, k):
+    """Similarity-derived statistics the assignment needs for each row of S."""
+    pmax = _parent_maxima(S, codes, n_parents)
+    best_parent = np.argmax(pmax, axis=1)
+    best_sim = pmax[np.arange(len(pmax)), best_parent].astype(np.float64)
+    if n_parents > 1:
+        pmax[np.arange(len(pmax)), best_parent] = -np.inf
+        second_sim = pmax.max(axis=1).astype(np.float64)
+    else:
+        second_sim = np.full(len(pmax), -1.0)
+    child_idx, child_sim = _top_children(S, codes, best_parent, k)
+    return {
+        "best_parent": best_parent,
+        "best_sim": best_sim,
+        "second_sim": second_sim,
+        "child_idx": child_idx,
+        "child_sim": child_sim.astype(np.float64),
+    }
+
+
+def _unit_rows(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def block_rows_for(n_cols, block_rows=None):
+    """Rows per similarity block: explicit setting, or the largest block fitting ASSIGN_MAX_BLOCK_MB."""
+    block_rows = block_rows or config.ASSIGN_BLOCK_ROWS
+    if block_rows:
+        return max(1, int(block_rows))
+    per_row = max(1, int(n_cols)) * _BYTES_PER_CELL
+    return max(1, int(config.ASSIGN_MAX_BLOCK_MB * 1024 * 1024 // per_row))
+
+
+def iter_similarity_blocks(em_emb, tax_emb, block_rows=None):
+    """Yield (row offset, float32 cosine block) without materializing the full N x P matrix."""
+    tax_u_t = np.ascontiguousarray(_unit_rows(tax_emb).T)
+    step = block_rows_for(tax_u_t.shape[1], block_rows)
+    # rows are normalized per block, so a memory-mapped em_emb is only paged in block by block
+    for start in range(0, len(em_emb), step):
+        yield start, _unit_rows(em_emb[start:start + step]) @ tax_u_t
+
+
+def score_blocked(em_emb, tax_emb, codes, n_parents, k, block_rows=None):
+    """score_parents_children over row blocks; only the per-row reductions are kept."""
+    parts = [score_parents_children(S, codes, n_parents, k) for _, S in iter_similarity_blocks(em_emb, tax_emb, block_rows)]
+    if not parts:
+        k = max(0, min(int(k), len(codes)))
+        return {"best_parent": np.zeros(0, dtype=np.int64), "best_sim": np.zeros(0), "second_sim": np.zeros(0),
+                "child_idx": np.zeros((0, k), dtype=np.int64), "child_sim": np.zeros((0, k))}
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def build_assignment_frame(ids, stats, parent_names, tax_paths,
+                           parent_min_sim=None, parent_margin=None, child_min_sim=None, child_margin=None, topk_child=None):
+    """Apply the parent/child thresholds to precomputed statistics and emit the raw assignment frame."""
+    parent_min_sim = config.PARENT_MIN_SIM if parent_min_sim is None else parent_min_sim
+    parent_margin = config.PARENT_MARGIN if parent_margin is None else parent_margin
+    child_min_sim = config.CHILD_MIN_SIM if child_min_sim is None else child_min_sim
+    child_margin = config.CHILD_MARGIN if child_margin is None else child_margin
+    topk_child = config.TOPK_CHILD if topk_child is None else topk_child
+
+    ids = pd.Series(list(ids)).to_numpy()
+    n = len(ids)
+    best_parent = stats["best_parent"]
+    best_sim = stats["best_sim"]
+    margin = best_sim - stats["second_sim"]
+    low_conf = margin < parent_margin
+    uncat = best_sim < parent_min_sim
+
+    k = max(0, min(int(topk_child), stats["child_idx"].shape[1]))
+    child_idx = stats["child_idx"][:, :k]
+    child_sim = stats["child_sim"][:, :k]
+    child_best = stats["child_sim"][:, :1] if stats["child_sim"].shape[1] else np.full((n, 1), -np.inf)
+    sel = (child_idx >= 0) & ((child_sim >= child_min_sim) | (child_best - child_sim <= child_margin))
+    # selection keeps a prefix of the ranked children
+    sel = np.cumprod(sel, axis=1).astype(bool)
+    sel[uncat] = False
+    n_sel = sel.sum(axis=1)
+    n_out = np.where(n_sel > 0, n_sel, 1)
+
+    row = np.repeat(np.arange(n), n_out)
+    rank = np.arange(len(row)) - np.repeat(np.cumsum(n_out) - n_out, n_out) + 1
+    has_child = n_sel[row] > 0
+    col = np.where(has_child, child_idx[row, np.minimum(rank - 1, max(k - 1, 0))] if k else -1, -1)
+
+    parent_arr = np.asarray(parent_names, dtype=object)
+    parent = parent_arr[best_parent[row]] if len(parent_arr) else np.full(len(row), "UNCAT", dtype=object)
+    tax_arr = np.asarray(tax_paths, dtype=object)
+    path = np.where(has_child, tax_arr[np.maximum(col, 0)] if len(tax_arr) else "", parent.astype(str) + " > OTHER").astype(object)
+    cosine = np.where(has_child, child_sim[row, np.minimum(rank - 1, max(k - 1, 0))] if k else 0.0, best_sim[row])
+
+    row_uncat = uncat[row]
+    path[row_uncat] = "UNCAT"
+    parent = parent.copy()
+    parent[row_uncat] = "UNCAT"
+
+    return pd.DataFrame({
+        "Accident ID": ids[row],
+        "Final_Category_Path": path,
+        "Cosine": cosine.astype(np.float64),
+        "Rank": rank.astype(np.int64),
+        "Selected": np.ones(len(row), dtype=bool),
+        "Below_UNCAT_Threshold": row_uncat,
+        "Parent": parent,
+        "Parent_Sim": best_sim[row],
+        "Parent_Margin": margin[row],
+        "Parent_LowConf": low_conf[row] | row_uncat,
+    }, columns=ASSIGN_COLUMNS)
+
+
+def assign_hierarchical(em, id_col, tax_paths, em_emb, tax_emb, block_rows=None, index=None, text_index=None, tree=None):
+    """Raw assignment per incident in `em`.
+
+    With `text_index`, em_emb holds one row per distinct text and text_index maps each incident to its row.
+    `tree` is the run's PathTree of the taxonomy (a throwaway one when omitted).
+    """
+    tree = PathTree() if tree is None else tree
+    parent_names, codes = parent_groups(tax_paths, tree)
+    if index is None and config.ASSIGN_USE_INDEX:
+        from tax_index import HierarchicalIndex
+        index = HierarchicalIndex(tax_paths, tax_emb, tree=tree)
+    if index is not None:
+        stats = index.score(em_emb, k=config.TOPK_CHILD, block_rows=block_rows)
+        if config.ASSIGN_INDEX_CHECK_SAMPLE:
+            from tax_index import check_recall
+            print(f"Index recall check: {check_recall(index, em_emb, tax_emb, sample=config.ASSIGN_INDEX_CHECK_SAMPLE)}")
+    elif config.ASSIGN_BLOCKED:
+        stats = score_blocked(em_emb, tax_emb, codes, len(parent_names), config.TOPK_CHILD, block_rows=block_rows)
+    else:
+        from sklearn.metrics.pairwise import cosine_similarity
+        S = cosine_similarity(em_emb, tax_emb)
+        stats = score_parents_children(S, codes, len(parent_names), config.TOPK_CHILD)
+    if text_index is not None:
+        stats = {key: v[text_index] for key, v in stats.items()}
+    return build_assignment_frame(em[id_col].tolist(), stats, parent_names, tax_paths)
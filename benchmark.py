@@ -0,0 +1,257 @@
+"""
+Offline scaling benchmark for the pipeline on synthetic eMARS exports and taxonomies.
+
+A deterministic hashing model stands in for SentenceTransformer, so no download or GPU is needed.
+Each stage is timed (wall and CPU) with its peak memory, and the results can be stored as a
+baseline and compared against later runs to flag regressions:
+
+    python benchmark.py --incidents 1 10 --paths 1000 20000 --save-baseline
+    python benchmark.py --incidents 1 10 --paths 1000 20000            # compares with the baseline
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+import config
+from instrument import StageMemory
+
+BASE_INCIDENTS = 1253  # rows in the shipped eMARS export, the 1x scale
+BENCH_DIR = os.path.join(".emars_cache", "bench")
+BASELINE_FILE = "benchmark_baseline.json"
+
+_ROOTS = ["causes", "equipment", "consequences", "substances", "human factors"]
+_WORDS = [
+    "pump", "centrifugal pump", "compressor", "motor", "gearbox", "turbine", "fan", "agitator", "valve", "pipe",
+    "flange", "gasket", "tank", "vessel", "reactor", "heat exchanger", "column", "seal", "bearing", "shaft",
+    "corrosion", "fatigue", "overpressure", "overheating", "leak", "rupture", "fire", "explosion", "release",
+    "toxic cloud", "operator error", "maintenance", "procedure", "alarm", "control system", "instrument",
+    "power failure", "ignition", "static discharge", "runaway reaction", "contamination", "ammonia", "chlorine",
+]
+_QUALIFIERS = ["failure", "damage", "leak", "malfunction", "blockage", "error", "loss", "defect"]
+_FILLER = ["the", "during", "was", "of", "a", "at", "after", "and", "in", "plant", "site", "operation", "unit", "area"]
+
+
+class HashingModel:
+    """Deterministic bag-of-words encoder with the SentenceTransformer.encode signature."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._vecs = {}
+
+    def _vec(self, tok):
+        v = self._vecs.get(tok)
+        if v is None:
+            v = np.random.default_rng(zlib.crc32(tok.encode("utf-8"))).standard_normal(self.dim).astype(np.float32)
+            self._vecs[tok] = v
+        return v
+
+    def encode(self, texts, normalize_embeddings=True, show_progress_bar=False, batch_size=32, **kw):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for tok in re.findall(r"[a-z0-9]+", str(t).lower()):
+                out[i] += self._vec(tok)
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            out /= norms
+        return out
+
+
+def make_taxonomy(n_paths, seed=0):
+    """Combined_Taxonomy-style frame with `n_paths` unique ' > '-joined paths up to depth 5."""
+    rng = np.random.default_rng(seed)
+    rows = [(r, 0, r) for r in _ROOTS]
+    frontier = list(_ROOTS)
+    seen = set(_ROOTS)
+    while len(rows) < n_paths and frontier:
+        nxt = []
+        for parent in frontier:
+            depth = parent.count(" > ") + 1
+            for _ in range(int(rng.integers(2, 12))):
+                if len(rows) >= n_paths:
+                    break
+                name = f"{_WORDS[rng.integers(len(_WORDS))]} {_QUALIFIERS[rng.integers(len(_QUALIFIERS))]}"
+                if rng.random() < 0.02:
+                    name = ("shaft failure", "bearing failure")[int(rng.integers(2))]
+                path = f"{parent} > {name}"
+                i = 2
+                while path in seen:
+                    path = f"{parent} > {name} {i}"
+                    i += 1
+                seen.add(path)
+                rows.append((path, depth, path.rsplit(" > ", 1)[1]))
+                if depth < 5:
+                    nxt.append(path)
+        frontier = nxt
+    return pd.DataFrame({
+        "Taxonomy": [p.split(" > ", 1)[0] for p, _, _ in rows],
+        "Depth": [float(d) for _, d, _ in rows],
+        "Node type": "Synthetic",
+        "Name": [n for _, _, n in rows],
+        "Path": [p for p, _, _ in rows],
+    })
+
+
+def make_emars(n_incidents, tax_paths, seed=0, dup_rate=0.05):
+    """eMARS-style frame; descriptions mix taxonomy leaf words with filler, a share are exact duplicates."""
+    rng = np.random.default_rng(seed)
+    titles, descs = [], []
+    for i in range(n_incidents):
+        if i and rng.random() < dup_rate:
+            j = int(rng.integers(i))
+            titles.append(titles[j])
+            descs.append(descs[j])
+            continue
+        leaf = tax_paths[int(rng.integers(len(tax_paths)))].rsplit(" > ", 1)[-1]
+        words = [_WORDS[k] for k in rng.integers(len(_WORDS), size=int(rng.integers(3, 12)))]
+        filler = [_FILLER[k] for k in rng.integers(len(_FILLER), size=int(rng.integers(5, 30)))]
+        body = words + filler + [leaf]
+        rng.shuffle(body)
+        titles.append(f"{leaf.capitalize()} at {_WORDS[int(rng.integers(len(_WORDS)))]}")
+        descs.append(" ".join(body).capitalize() + ".")
+    return pd.DataFrame({
+        "Accident ID": np.arange(1, n_incidents + 1),
+        "Accident Title": titles,
+        "Accident Description": descs,
+    })
+
+
+def generate(incident_scale, n_paths, seed=0, bench_dir=BENCH_DIR):
+    """Write (or reuse) the synthetic workbooks for one scale; returns (emars_xlsx, taxon_xlsx)."""
+    os.makedirs(bench_dir, exist_ok=True)
+    n_inc = int(round(BASE_INCIDENTS * incident_scale))
+    tax_xlsx = os.path.join(bench_dir, f"taxonomy_{n_paths}_s{seed}.xlsx")
+    em_xlsx = os.path.join(bench_dir, f"emars_{n_inc}_{n_paths}_s{seed}.xlsx")
+    tx = None
+    if not os.path.exists(tax_xlsx):
+        tx = make_taxonomy(n_paths, seed)
+        tx.to_excel(tax_xlsx, sheet_name="Combined_Taxonomy", index=False)
+    if not os.path.exists(em_xlsx):
+        if tx is None:
+            tx = pd.read_excel(tax_xlsx)
+        make_emars(n_inc, tx["Path"].tolist(), seed).to_excel(em_xlsx, sheet_name="Accidents", index=False)
+    return em_xlsx, tax_xlsx
+
+
+class StageTimer:
+    """Collects wall/CPU time, entry RSS and the stage's own peak RSS per named stage."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kw):
+        if self.trace_memory:
+            tracemalloc.start()
+        with StageMemory() as mem:
+            w, c = time.perf_counter(), time.process_time()
+            out = fn(*args, **kw)
+            rec = {"wall_s": round(time.perf_counter() - w, 4), "cpu_s": round(time.process_time() - c, 4)}
+        rec.update(mem.record())
+        if self.trace_memory:
+            rec["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.stop()
+        self.stages[name] = rec
+        return out
+
+
+def run_scale(incident_scale, n_paths, seed=0, trace_memory=False, bench_dir=BENCH_DIR):
+    from data import load_emars, load_taxonomy
+    from embeddings import encode_all
+    from assign import assign_hierarchical
+    from consolidate import consolidate_and_disambiguate
+    from evidence import prepare_expected_terms_cache, apply_evidence_gate
+    from render import collapse_sparse_children, depth_aware_render, export_graph
+
+    em_xlsx, tax_xlsx = generate(incident_scale, n_paths, seed, bench_dir)
+    t = StageTimer(trace_memory)
+    with tempfile.TemporaryDirectory() as tmp:
+        # cold Excel cache: load_emars includes the one-off workbook conversion
+        excel_cache_dir, config.EXCEL_CACHE_DIR = config.EXCEL_CACHE_DIR, os.path.join(tmp, "excel")
+        try:
+            em, id_col, _, _ = t.run("load_emars", load_emars, em_xlsx)
+            _, _, tax_paths = t.run("load_taxonomy", load_taxonomy, tax_xlsx)
+            tax_emb, em_emb = t.run("encode_all", encode_all, HashingModel(), tax_paths, em["_emars_text_"].tolist(), show_progress_bar=False)
+            raw = t.run("assign_hierarchical", assign_hierarchical, em, id_col, tax_paths, em_emb, tax_emb)
+            cons = t.run("consolidate_and_disambiguate", consolidate_and_disambiguate, raw, em, id_col)
+            cache = t.run("prepare_expected_terms_cache", prepare_expected_terms_cache, cons, tax_xlsx)
+            ev = t.run("apply_evidence_gate", apply_evidence_gate, cons, em, cache)
+            rend = t.run("render", lambda df: depth_aware_render(collapse_sparse_children(df)), ev)
+            t.run("export_graph", export_graph, rend, os.path.join(tmp, "tree.dot"), os.path.join(tmp, "tree.pdf"))
+        finally:
+            config.EXCEL_CACHE_DIR = excel_cache_dir
+    return {
+        "incidents": len(em), "paths": len(tax_paths), "rows_raw": len(raw), "rows_evidence": len(ev),
+        "total_wall_s": round(sum(s["wall_s"] for s in t.stages.values()), 4), "stages": t.stages,
+    }
+
+
+def compare(results, baseline, tolerance=1.25, min_delta_s=0.05):
+    """(scale, stage, base_s, new_s) for every stage slower than tolerance x baseline (and by min_delta_s)."""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for stage, rec in res["stages"].items():
+            old = base["stages"].get(stage, {}).get("wall_s")
+            if old is not None and rec["wall_s"] > old * tolerance and rec["wall_s"] - old > min_delta_s:
+                regressions.append((key, stage, old, rec["wall_s"]))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--incidents", type=float, nargs="+", default=[1], help="multiples of the shipped export (1253 rows)")
+    ap.add_argument("--paths", type=int, nargs="+", default=[1000], help="taxonomy sizes")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=1.25)
+    ap.add_argument("--trace-memory", action="store_true", help="per-stage Python allocation peak (slower)")
+    ap.add_argument("--out", help="write the results JSON here")
+    args = ap.parse_args(argv)
+
+    results = {}
+    for scale in args.incidents:
+        for n_paths in args.paths:
+            key = f"inc{scale:g}x_paths{n_paths}"
+            res = run_scale(scale, n_paths, args.seed, args.trace_memory)
+            results[key] = res
+            print(f"{key}: {res['incidents']} incidents, {res['paths']} paths, total {res['total_wall_s']:.2f}s")
+            for stage, rec in res["stages"].items():
+                print(f"  {stage:<30} wall {rec['wall_s']:>8.3f}s  cpu {rec['cpu_s']:>8.3f}s  rss {rec['rss_start_mb']} MB, stage peak {rec['peak_rss_mb']} MB")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for key, stage, old, new in regressions:
+            print(f"REGRESSION {key} {stage}: {old:.3f}s -> {new:.3f}s")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Stage checkpoints for run_all: each stage output is stored with a fingerprint of its inputs
+(upstream fingerprint, input workbooks, the config values the stage reads) and reused while
+that fingerprint still matches.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import config
+from state import file_signature
+
+STAGE_ORDER = ("embeddings", "raw", "consolidated", "evidence", "rendered")
+
+# config values read by each stage; a stage's fingerprint also covers everything upstream of it
+STAGE_CONFIG = {
+    "embeddings": ("MODEL_NAME", "DEDUP_TEXTS", "PERSIST_EMBEDDINGS", "EMBED_STORE_DTYPE"),
+    "raw": ("PARENT_MIN_SIM", "PARENT_MARGIN", "TOPK_CHILD", "CHILD_MIN_SIM", "CHILD_MARGIN", "ASSIGN_BLOCKED",
+            "ASSIGN_USE_INDEX", "ASSIGN_INDEX_PARENT_SHORTLIST", "ASSIGN_INDEX_DEEP", "ASSIGN_INDEX_GROUP_SHORTLIST"),
+    "consolidated": (),
+    "evidence": ("EVIDENCE_MATCH_MODE", "EVIDENCE_COVERAGE_MIN", "EVIDENCE_MIN_TERM_LEN", "EVIDENCE_USE_KEYWORDS_ORIGINAL",
+                 "EVIDENCE_MAX_TERMS_PER_PATH", "EVIDENCE_MIN_MATCHED_TERMS", "EVIDENCE_FALLBACK_COSINE",
+                 "USE_MISSING_WORD_GUARD", "MISSING_TERMS_CSV", "MISSING_GUARD_MIN_INSTANCES", "MISSING_GUARD_MAX_TERMS_PER_PATH",
+                 "ENABLE_PARENT_BACKOFF", "PARENT_BACKOFF_COVERAGE_MIN", "PARENT_BACKOFF_MIN_MATCHED_TERMS",
+                 "PARENT_BACKOFF_MIN_COSINE", "ENABLE_MISSED_OPPORTUNITY_PATCH", "ENABLE_RUNAWAY_PARENT_PATCH",
+                 "RUNAWAY_PARENT_MIN_COSINE"),
+    "rendered": ("MIN_CHILD_SUPPORT", "MAX_CHILD_PER_PARENT", "ENABLE_DEPTH_AWARE_RENDER", "MAX_DEPTH_RENDER",
+                 "MIN_LEAF_SUPPORT_RENDER", "DEPTH_CAP_LABEL", "LOW_SUPPORT_LABEL"),
+}
+
+
+def _signature(path):
+    return file_signature(path) if os.path.exists(path) else path
+
+
+def stage_fingerprints(emars_xlsx, taxon_xlsx):
+    """{stage: fingerprint}, chained so any upstream change invalidates every later stage."""
+    fps = {}
+    prev = {"EMARS_XLSX": _signature(emars_xlsx), "TAXON_XLSX": _signature(taxon_xlsx)}
+    for stage in STAGE_ORDER:
+        payload = {"upstream": prev, **{k: getattr(config, k, None) for k in STAGE_CONFIG[stage]}}
+        fps[stage] = prev = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return fps
+
+
+def resolve_stages(resume_from=None, only=None):
+    """(stages recomputed even if checkpointed, stages to run at all; None = every stage)."""
+    for s in ([resume_from] if resume_from else []) + list(only or []):
+        if s not in STAGE_ORDER:
+            raise ValueError(f"unknown stage {s!r}; expected one of {STAGE_ORDER}")
+    force = set(STAGE_ORDER[STAGE_ORDER.index(resume_from):]) if resume_from else set()
+    if not only:
+        return force, None
+    only = set(only)
+    return force | only, set(STAGE_ORDER[:max(STAGE_ORDER.index(s) for s in only) + 1])
+
+
+class CheckpointStore:
+    def __init__(self, ckpt_dir, fingerprints):
+        self.dir = ckpt_dir
+        self.fingerprints = fingerprints
+
+    def _meta_path(self, stage):
+        return os.path.join(self.dir, f"{stage}.json")
+
+    def load(self, stage):
+        """The checkpointed output of `stage`, or None if missing or made from other inputs."""
+        try:
+            with open(self._meta_path(stage), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != self.fingerprints[stage]:
+                return None
+            path = os.path.join(self.dir, meta["file"])
+            if meta["kind"] == "arrays":
+                with np.load(path, allow_pickle=False) as z:
+                    return tuple(z[k] if k is not None else None for k in meta["keys"])
+            return pd.read_pickle(path)
+        except Exception:
+            return None
+
+    def save(self, stage, obj):
+        os.makedirs(self.dir, exist_ok=True)
+        if isinstance(obj, tuple):
+            arrays = {f"a{i}": np.asarray(a) for i, a in enumerate(obj) if a is not None}
+            keys = [f"a{i}" if a is not None else None for i, a in enumerate(obj)]
+            meta = {"kind": "arrays", "file": f"{stage}.npz", "keys": keys}
+            tmp = os.path.join(self.dir, f"{stage}.tmp.npz")
+            np.savez(tmp, **arrays)
+        else:
+            meta = {"kind": "frame", "file": f"{stage}.pkl"}
+            tmp = os.path.join(self.dir, f"{stage}.tmp.pkl")
+            obj.to_pickle(tmp)
+        os.replace(tmp, os.path.join(self.dir, meta["file"]))
+        meta["fingerprint"] = self.fingerprints[stage]
+        with open(self._meta_path(stage), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
@@ -0,0 +1,112 @@
+"""
+Command-line entry point running one pipeline stage at a time; each stage reads the previous
+stage's output from the working directory, so e.g. re-rendering never loads the embedding model.
+
+    python cli.py encode      # embeddings -> EMBED_STORE_DIR
+    python cli.py assign      # -> raw + consolidated assignment
+    python cli.py evidence    # -> evidence-locked assignment
+    python cli.py render      # -> rendered assignment + graph files
+
+Only config is imported up front; each subcommand imports the modules (and heavy dependencies) it uses.
+"""
+import os
+import sys
+import argparse
+import config
+
+
+def _load_inputs(args, taxonomy=True):
+    from data import load_emars, load_taxonomy
+    em, id_col, _, _ = load_emars(args.emars or config.EMARS_XLSX)
+    tax_paths = load_taxonomy(args.taxonomy or config.TAXON_XLSX)[2] if taxonomy else None
+    return em, id_col, tax_paths
+
+
+def _write(args, frames):
+    from writer import OutputWriter, OUTPUT_NAMES
+    with OutputWriter(args.dir, fmt=args.format, background=False) as writer:
+        for stage, df in frames:
+            writer.submit(df, OUTPUT_NAMES[stage], stage)
+
+
+def _read(args, stage):
+    from writer import read_frame, OUTPUT_NAMES
+    return read_frame(os.path.join(args.dir, OUTPUT_NAMES[stage]), args.format)
+
+
+def cmd_encode(args):
+    from main import _encode
+    em, id_col, tax_paths = _load_inputs(args)
+    _encode(em, id_col, tax_paths, persist=True)
+
+
+def cmd_assign(args):
+    from emb_store import open_matrix
+    from assign import assign_hierarchical
+    from consolidate import consolidate_and_disambiguate
+    from tax_tree import PathTree
+    em, id_col, tax_paths = _load_inputs(args)
+    tree = PathTree(tax_paths)
+    try:
+        tax_emb, em_emb = open_matrix(config.EMBED_STORE_DIR, "taxonomy"), open_matrix(config.EMBED_STORE_DIR, "incidents")
+    except FileNotFoundError:
+        raise SystemExit(f"No embeddings in {config.EMBED_STORE_DIR}; run `python cli.py encode` first")
+    if list(tax_emb.ids) != list(tax_paths):
+        raise SystemExit("Taxonomy embeddings are out of date; rerun `python cli.py encode`")
+    try:
+        text_index = em_emb.rows_for(em[id_col].tolist())
+    except KeyError as e:
+        raise SystemExit(f"Incident {e} has no stored embedding; rerun `python cli.py encode`")
+    from state import text_hashes
+    stored = dict(zip(em_emb.ids, em_emb.meta.get("text_sha1") or []))
+    stale = [k for k, h in text_hashes(em, id_col).items() if stored.get(k) != h]
+    if stale:
+        raise SystemExit(f"{len(stale)} incident(s) changed since `encode` (e.g. {stale[0]!r}); rerun `python cli.py encode`")
+    raw = assign_hierarchical(em, id_col, tax_paths, em_emb, tax_emb, text_index=text_index, tree=tree)
+    _write(args, [("raw", raw), ("consolidated", consolidate_and_disambiguate(raw, em, id_col, tree=tree))])
+
+
+def cmd_evidence(args):
+    from evidence import prepare_expected_terms_cache, apply_evidence_gate
+    from tax_tree import PathTree
+    em, _, _ = _load_inputs(args, taxonomy=False)
+    assign = _read(args, "consolidated")
+    tree = PathTree()
+    path_term_cache = prepare_expected_terms_cache(assign, args.taxonomy or config.TAXON_XLSX, tree)
+    _write(args, [("evidence", apply_evidence_gate(assign, em, path_term_cache, tree=tree))])
+
+
+def cmd_render(args):
+    from render import collapse_sparse_children, depth_aware_render, export_graph
+    from tax_tree import PathTree
+    tree = PathTree()
+    rendered = depth_aware_render(collapse_sparse_children(_read(args, "evidence"), tree=tree), tree=tree)
+    _write(args, [("rendered", rendered)])
+    if not args.no_graph:
+        dot, pdf = export_graph(rendered, os.path.join(args.dir, "categorisation_tree_FINAL.dot"),
+                                os.path.join(args.dir, "categorisation_tree_FINAL.pdf"))
+        print(f"Graph files: {dot}, {pdf}")
+
+
+COMMANDS = {"encode": cmd_encode, "assign": cmd_assign, "evidence": cmd_evidence, "render": cmd_render}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--dir", default=".", help="directory holding the stage outputs (default: current directory)")
+    ap.add_argument("--emars", help=f"eMARS workbook (default {config.EMARS_XLSX})")
+    ap.add_argument("--taxonomy", help=f"taxonomy workbook (default {config.TAXON_XLSX})")
+    ap.add_argument("--format", choices=["csv", "csv.gz", "parquet"], help=f"output format (default {config.OUTPUT_FORMAT})")
+    sub = ap.add_subparsers(dest="command", required=True)
+    for name in COMMANDS:
+        p = sub.add_parser(name)
+        if name == "render":
+            p.add_argument("--no-graph", action="store_true", help="skip the dot/pdf export")
+    args = ap.parse_args(argv)
+    os.makedirs(args.dir, exist_ok=True)
+    COMMANDS[args.command](args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
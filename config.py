@@ -7,9 +7,56 @@ import os
 EMARS_XLSX = os.environ.get("EMARS_XLSX", "eMARS_Export_01-12-2025.xlsx")
 TAXON_XLSX = os.environ.get("TAXON_XLSX", "Taxonomy_DEXPI_Hierarchical.xlsx")
 
+# --- Columnar cache of the Excel inputs ---
+ENABLE_EXCEL_CACHE = os.environ.get("ENABLE_EXCEL_CACHE", "1") != "0"
+EXCEL_CACHE_DIR = os.environ.get("EXCEL_CACHE_DIR", ".emars_cache/excel")
+
 # --- Embedding model (SentenceTransformers) ---
 MODEL_NAME = os.environ.get("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
 
+# --- Encoding throughput ---
+DEDUP_TEXTS = True             # encode and score each distinct incident text once, fan results out per Accident ID
+ENCODE_BATCH_SIZE = int(os.environ.get("ENCODE_BATCH_SIZE", "64"))
+ENCODE_WORKERS = int(os.environ.get("ENCODE_WORKERS", "1"))          # >1: fan batches out to CPU worker processes
+ENCODE_POOL_MIN_TEXTS = 2000   # below this many texts to encode, worker start-up costs more than it saves
+
+# --- Embedding cache (content-addressed, on disk) ---
+ENABLE_EMBED_CACHE = os.environ.get("ENABLE_EMBED_CACHE", "1") != "0"
+EMBED_CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", ".emars_cache/embeddings")
+EMBED_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # evict least-recently-used shards above this size
+
+# --- Persisted embedding matrices (memory-mapped .npy + ID sidecar) ---
+PERSIST_EMBEDDINGS = os.environ.get("PERSIST_EMBEDDINGS", "0") == "1"
+EMBED_STORE_DIR = os.environ.get("EMBED_STORE_DIR", ".emars_cache/matrices")
+EMBED_STORE_DTYPE = os.environ.get("EMBED_STORE_DTYPE", "float32")   # float32 | float16 | int8 (per-row scales)
+
+# --- Output files (CSV outputs of run_all) ---
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "csv")   # csv | csv.gz | parquet (zstd)
+OUTPUT_COMPRESSION_LEVEL = None   # gzip 1-9 / zstd level; None = library default
+OUTPUT_BACKGROUND = True          # serialize on a worker thread while later stages run
+
+# --- Run report (per-stage timings, memory, row counts) ---
+RUN_REPORT_FILE = "run_report.json"   # written next to the CSVs
+PROFILE_STAGE = os.environ.get("PROFILE_STAGE", "")   # e.g. "evidence": cProfile that stage into the report
+
+# --- Stage checkpoints (run_all resume_from / only) ---
+ENABLE_CHECKPOINTS = os.environ.get("ENABLE_CHECKPOINTS", "0") == "1"
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", ".emars_cache/checkpoints")
+
+# --- Classification service (service.py) ---
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", "8765"))
+SERVICE_MAX_BATCH = 64        # incidents per encode call
+SERVICE_BATCH_WAIT_MS = 5     # how long a batch waits for more concurrent requests
+SERVICE_SEED_DIR = os.environ.get("SERVICE_SEED_DIR", ".")   # run_all save_dir whose consolidated output seeds the evidence term cache; "" = no seed
+
+# --- Streaming classifier (stream.py) ---
+STREAM_CHUNK_ROWS = int(os.environ.get("STREAM_CHUNK_ROWS", "5000"))   # incidents per chunk
+STREAM_SPILL_DIR = os.environ.get("STREAM_SPILL_DIR") or None        # chunk spill files; None = system temp dir
+
+# --- Incremental runs (run_all(incremental=True)) ---
+INCREMENTAL_STATE_DIR = os.environ.get("INCREMENTAL_STATE_DIR", ".emars_cache/state")
+
 # --- Multi-label settings ---
 TOPK = 3
 THRESH = 0.35
@@ -27,6 +74,18 @@ TOPK_CHILD = 2
 CHILD_MIN_SIM = 0.40
 CHILD_MARGIN = 0.015
 
+# --- Blocked similarity (memory-bounded assignment) ---
+ASSIGN_BLOCKED = True          # score incidents in row blocks with float32 dot products
+ASSIGN_BLOCK_ROWS = 0          # fixed rows per block; 0 derives it from ASSIGN_MAX_BLOCK_MB
+ASSIGN_MAX_BLOCK_MB = 512      # peak working memory per block (similarities + reductions)
+
+# --- Two-stage taxonomy index (approximate; for very large taxonomies) ---
+ASSIGN_USE_INDEX = False             # score parent centroids first, then children of shortlisted parents only
+ASSIGN_INDEX_PARENT_SHORTLIST = 5    # parents searched exactly per incident
+ASSIGN_INDEX_DEEP = False            # add a level of centroids over the first two path segments
+ASSIGN_INDEX_GROUP_SHORTLIST = 8     # second-level groups searched per shortlisted parent (deep mode)
+ASSIGN_INDEX_CHECK_SAMPLE = 0        # >0: also score this many incidents exactly and report recall
+
 # --- Child overload control for tree ---
 MIN_CHILD_SUPPORT = 4
 MAX_CHILD_PER_PARENT = 25
@@ -1,9 +1,11 @@
 """
 Consolidation and DEXPI-aided disambiguation adapted from the notebook.
 """
+import numpy as np
 import pandas as pd
 import re
-from utils import norm_label, split_any, join_path, canonical_phrase, infer_equipment_family
+from utils import norm_label, join_path, canonical_phrase, infer_equipment_families
+from tax_tree import PathTree
 
 # Canonical map (conservative subset from notebook)
 CANON_LEAF_MAP = {
@@ -18,40 +20,59 @@ CANON_LEAF_MAP = {
 CONTEXT_MERGE = { ("pressure raising or reducing equipment", "compressor"): "pump or compressor components" }
 
 
-def consolidate_and_disambiguate(assign_df: pd.DataFrame, em_df: pd.DataFrame, id_col: str):
-    inc_text_map = dict(zip(em_df[id_col].tolist(), em_df["_emars_text_"].tolist()))
-    out = []
-    for _, r in assign_df.iterrows():
-        path = r["Final_Category_Path"]
-        inc_id = r["Accident ID"]
-        if path == "UNCAT":
-            out.append({**r, "Consolidated_Path": "UNCAT"})
-            continue
-        parts = split_any(path)
-        leaf = parts[-1] if parts else path
-        leaf_n = norm_label(leaf)
-        if leaf_n in CANON_LEAF_MAP:
-            p0, p1, pleaf = CANON_LEAF_MAP[leaf_n]
-            cons_parts = [p0, p1, pleaf]
-        else:
-            cons_parts = parts
-        if len(cons_parts) >= 2:
-            parent_seg = norm_label(cons_parts[-2])
-            child_seg = norm_label(cons_parts[-1])
-            key = (parent_seg, child_seg)
-            if key in CONTEXT_MERGE:
-                cons_parts[-1] = CONTEXT_MERGE[key]
-        # special mapping
-        if norm_label(leaf) == "combustion/explosion causes overpressure":
-            cons_parts = ["Process deviation", "Pressure deviation", "Internal overpressure (gas)", "Combustion/explosion causes overpressure"]
-
-        # DEXPI-aided disambiguation
-        cons_leaf_n = norm_label(cons_parts[-1]) if cons_parts else ""
-        if cons_leaf_n in ("shaft failure", "bearing failure"):
-            fam = infer_equipment_family(inc_text_map.get(inc_id, ""))
-            fam = fam or "Unknown equipment"
-            cons_parts = ["Mechanical / Rotating equipment", fam, cons_parts[-1].title()]
-
-        cons_parts = [canonical_phrase(p) for p in cons_parts]
-        out.append({**r, "Consolidated_Path": join_path(cons_parts)})
-    return pd.DataFrame(out)
+DEXPI_DISAMBIGUATE_LEAVES = ("shaft failure", "bearing failure")
+
+
+def _consolidate_path(path, tree):
+    """Path-only consolidation. Returns (consolidated path, None), or (None, leaf) when the
+    leaf needs DEXPI disambiguation from the incident text."""
+    if path == "UNCAT":
+        return "UNCAT", None
+    parts = tree.parts(tree.add(path))
+    leaf = parts[-1] if parts else path
+    leaf_n = norm_label(leaf)
+    if leaf_n in CANON_LEAF_MAP:
+        p0, p1, pleaf = CANON_LEAF_MAP[leaf_n]
+        cons_parts = [p0, p1, pleaf]
+    else:
+        cons_parts = parts
+    if len(cons_parts) >= 2:
+        parent_seg = norm_label(cons_parts[-2])
+        child_seg = norm_label(cons_parts[-1])
+        key = (parent_seg, child_seg)
+        if key in CONTEXT_MERGE:
+            cons_parts[-1] = CONTEXT_MERGE[key]
+    # special mapping
+    if leaf_n == "combustion/explosion causes overpressure":
+        cons_parts = ["Process deviation", "Pressure deviation", "Internal overpressure (gas)", "Combustion/explosion causes overpressure"]
+
+    # DEXPI-aided disambiguation happens per incident
+    cons_leaf_n = norm_label(cons_parts[-1]) if cons_parts else ""
+    if cons_leaf_n in DEXPI_DISAMBIGUATE_LEAVES:
+        return None, cons_parts[-1].title()
+    return join_path([canonical_phrase(p) for p in cons_parts]), None
+
+
+def consolidate_and_disambiguate(assign_df: pd.DataFrame, em_df: pd.DataFrame, id_col: str, tree: PathTree = None):
+    """Consolidated_Path per assignment row; `tree` is the run's PathTree (a throwaway one when omitted)."""
+    tree = PathTree() if tree is None else tree
+    out = assign_df.reset_index(drop=True).copy()
+    # path-only work once per distinct path, broadcast back through the factorized codes
+    codes, uniques = pd.factorize(out["Final_Category_Path"], use_na_sentinel=False)
+    resolved = [_consolidate_path(p, tree) for p in uniques]
+    cons = np.array([c for c, _ in resolved], dtype=object)[codes]
+
+    pending = np.array([c is None for c, _ in resolved], dtype=bool)[codes]
+    if pending.any():
+        inc_text_map = dict(zip(em_df[id_col].tolist(), em_df["_emars_text_"].tolist()))
+        dexpi_leaf = np.array([leaf for _, leaf in resolved], dtype=object)[codes]
+        pending_ids = pd.unique(out.loc[pending, "Accident ID"])
+        fam_of = dict(zip(pending_ids, infer_equipment_families([inc_text_map.get(i, "") for i in pending_ids]).tolist()))
+        rendered = {}
+        for i in np.nonzero(pending)[0]:
+            key = (fam_of[out.at[i, "Accident ID"]] or "Unknown equipment", dexpi_leaf[i])
+            if key not in rendered:
+                rendered[key] = join_path([canonical_phrase(p) for p in ["Mechanical / Rotating equipment", key[0], key[1]]])
+            cons[i] = rendered[key]
+    out["Consolidated_Path"] = cons
+    return out
@@ -1,15 +1,130 @@
 """
 Data loading utilities: load eMARS and taxonomy and produce canonical taxonomy paths.
+
+Excel workbooks are converted once to a columnar (Parquet) cache under EXCEL_CACHE_DIR and
+served from there while the file's size/mtime (or, failing that, content hash) is unchanged.
 """
 import os
+import json
+import hashlib
 import pandas as pd
+import config
 from utils import norm_text, pick_col, pick_tax_col
 
+_WORKBOOK_MEMO = {}
+
+
+def _file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_sheet(df, base):
+    """Write one sheet as Parquet, or pickle when pyarrow is missing / the frame has mixed-type columns."""
+    try:
+        df.to_parquet(base + ".parquet", index=False)
+        return os.path.basename(base) + ".parquet"
+    except Exception:
+        if os.path.exists(base + ".parquet"):
+            os.remove(base + ".parquet")
+        df.to_pickle(base + ".pkl")
+        return os.path.basename(base) + ".pkl"
+
+
+def _read_sheet_file(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _convert_workbook(path, cache_dir, stat, digest):
+    sheets = pd.read_excel(path, sheet_name=None)
+    os.makedirs(cache_dir, exist_ok=True)
+    files = {}
+    for i, (name, df) in enumerate(sheets.items()):
+        files[name] = _write_sheet(df, os.path.join(cache_dir, f"sheet_{i:02d}"))
+    manifest = {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "sha1": digest, "sheets": list(sheets), "files": files}
+    with open(os.path.join(cache_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return sheets
+
+
+def _cached_sheets(path):
+    """{sheet name: DataFrame} from the Parquet cache, memoized per path; callers copy what they hand out."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    stat = os.stat(path)
+    abspath = os.path.abspath(path)
+    memo_key = (stat.st_size, stat.st_mtime_ns)
+    memo = _WORKBOOK_MEMO.get(abspath)
+    if memo is not None and memo[0] == memo_key:
+        return memo[1]
+
+    cache_dir = os.path.join(config.EXCEL_CACHE_DIR, hashlib.sha1(abspath.encode("utf-8")).hexdigest()[:16])
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    sheets = None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        fresh = manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns
+        if not fresh and manifest["size"] == stat.st_size and manifest["sha1"] == _file_digest(path):
+            # touched but identical content: keep the cache, remember the new mtime
+            manifest["mtime_ns"] = stat.st_mtime_ns
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            fresh = True
+        if fresh:
+            sheets = {name: _read_sheet_file(os.path.join(cache_dir, manifest["files"][name])) for name in manifest["sheets"]}
+    except Exception:
+        sheets = None
+    if sheets is None:
+        sheets = _convert_workbook(path, cache_dir, stat, _file_digest(path))
+    _WORKBOOK_MEMO[abspath] = (memo_key, sheets)   # one entry per workbook: a changed file replaces it
+    return sheets
+
+
+def read_workbook(path):
+    """All sheets of an Excel workbook as {sheet name: DataFrame}, in workbook order."""
+    if not config.ENABLE_EXCEL_CACHE:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return pd.read_excel(path, sheet_name=None)
+    return {k: v.copy() for k, v in _cached_sheets(path).items()}
+
+
+def workbook_sheet_names(path):
+    if not config.ENABLE_EXCEL_CACHE:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        with pd.ExcelFile(path) as xl:
+            return list(xl.sheet_names)
+    return list(_cached_sheets(path))
+
+
+def read_sheet(path, sheet_name=0):
+    """Like pd.read_excel(path, sheet_name=...) for one sheet (name or position), served from the cache."""
+    if not config.ENABLE_EXCEL_CACHE:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return pd.read_excel(path, sheet_name=sheet_name)
+    sheets = _cached_sheets(path)
+    if isinstance(sheet_name, int):
+        return list(sheets.values())[sheet_name].copy()
+    return sheets[sheet_name].copy()
+
 
 def load_emars(path):
     if not os.path.exists(path):
         raise FileNotFoundError(path)
-    em = pd.read_excel(path)
+    return prepare_emars_frame(read_sheet(path))
+
+
+def prepare_emars_frame(em):
+    """Detect the id/title/description columns of an eMARS frame and add the normalized text columns."""
     # auto-detect text columns
     id_col = pick_col(em.columns, ["accident id", "incident id", "id"]) or em.columns[0]
     title_col = pick_col(em.columns, ["title", "accident title", "incident title", "event title"])
@@ -24,7 +139,7 @@ def load_emars(path):
 def load_taxonomy(path):
     if not os.path.exists(path):
         raise FileNotFoundError(path)
-    tx = pd.read_excel(path)
+    tx = read_sheet(path)
     tax_path_col = pick_tax_col(tx)
     tx[tax_path_col] = tx[tax_path_col].fillna("").astype(str).map(lambda s: s.strip())
     tax_paths = [p for p in tx[tax_path_col].tolist() if p]
@@ -0,0 +1,115 @@
+"""
+On-disk embedding matrices: `<name>.npy` (float32, float16 or int8 with per-row scales in
+`<name>.scales.npy`) plus an ID sidecar `<name>.ids.json`, opened memory-mapped so several
+readers share the same pages instead of holding a copy each.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+STORE_DTYPES = ("float32", "float16", "int8")
+
+
+def _paths(store_dir, name):
+    base = os.path.join(store_dir, name)
+    return base + ".npy", base + ".scales.npy", base + ".ids.json"
+
+
+def _atomic_save(path, arr):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+def quantize_int8(x):
+    """Symmetric per-row int8 quantization: (codes, float32 scales) with x ~= codes * scales[:, None]."""
+    x = np.asarray(x, dtype=np.float32)
+    scales = np.abs(x).max(axis=1) / 127.0 if len(x) else np.zeros(0, np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8), scales
+
+
+def save_matrix(store_dir, name, emb, ids, dtype="float32", row_of=None, meta=None):
+    """Persist `emb` with its row ids.
+
+    `row_of` (optional) maps each id to a matrix row, for matrices holding one row per distinct text.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"dtype must be one of {STORE_DTYPES}, got {dtype!r}")
+    os.makedirs(store_dir, exist_ok=True)
+    npy_path, scales_path, ids_path = _paths(store_dir, name)
+    emb = np.asarray(emb, dtype=np.float32)
+    if dtype == "int8":
+        codes, scales = quantize_int8(emb)
+        _atomic_save(npy_path, codes)
+        _atomic_save(scales_path, scales)
+    else:
+        _atomic_save(npy_path, emb.astype(dtype, copy=False))
+        if os.path.exists(scales_path):
+            os.remove(scales_path)
+    sidecar = {
+        "dtype": dtype,
+        "shape": list(emb.shape),
+        "ids": pd.Series(list(ids), dtype=object).tolist(),
+        "row_of": None if row_of is None else np.asarray(row_of, dtype=np.int64).tolist(),
+        "meta": meta or {},
+    }
+    tmp = ids_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, default=lambda v: v.item() if hasattr(v, "item") else str(v))
+    os.replace(tmp, ids_path)
+    return npy_path
+
+
+class EmbeddingMatrix:
+    """Read-only, memory-mapped embedding matrix.
+
+    Slicing (`m[a:b]`, `m[idx_array]`) returns float32 rows, dequantizing int8 on the fly, so
+    assign.iter_similarity_blocks can consume it block by block without loading the whole file.
+    """
+
+    def __init__(self, data, scales, ids, row_of=None, meta=None):
+        self.data = data
+        self.scales = scales
+        self.ids = ids
+        self.row_of = row_of
+        self.meta = meta or {}
+
+    @property
+    def dtype(self):
+        return "int8" if self.scales is not None else str(self.data.dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        rows = np.asarray(self.data[key], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * np.asarray(self.scales[key], dtype=np.float32)[..., None]
+        return rows
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        return out.astype(dtype, copy=False) if dtype is not None else out
+
+    def rows_for(self, ids):
+        """Matrix row for each of `ids` (raises KeyError for unknown ids)."""
+        pos = {k: i for i, k in enumerate(self.ids)}
+        idx = np.array([pos[k] for k in ids], dtype=np.int64)
+        return self.row_of[idx] if self.row_of is not None else idx
+
+
+def open_matrix(store_dir, name, mmap=True):
+    npy_path, scales_path, ids_path = _paths(store_dir, name)
+    with open(ids_path, "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    mode = "r" if mmap else None
+    data = np.load(npy_path, mmap_mode=mode)
+    scales = np.load(scales_path, mmap_mode=mode) if sidecar["dtype"] == "int8" else None
+    row_of = np.asarray(sidecar["row_of"], dtype=np.int64) if sidecar.get("row_of") is not None else None
+    return EmbeddingMatrix(data, scales, sidecar["ids"], row_of=row_of, meta=sidecar.get("meta"))
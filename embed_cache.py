@@ -0,0 +1,146 @@
+"""
+Persistent, content-addressed embedding store used by embeddings.encode_all.
+
+Vectors are keyed by (model name, normalize flag, sha1 of the text). Each model/normalize
+pair lives in its own sub-directory made of append-only shards, so a refresh only encodes
+texts that were never seen before and writes them as one new shard.
+"""
+import os
+import re
+import glob
+import time
+import shutil
+import hashlib
+import numpy as np
+
+
+def text_key(text) -> str:
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()
+
+
+def _model_slug(model_name: str, normalize: bool) -> str:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", str(model_name)).strip("_") or "model"
+    return f"{slug}__{'norm' if normalize else 'raw'}"
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str, normalize: bool = True, max_bytes: int = None):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.normalize = bool(normalize)
+        self.max_bytes = max_bytes
+        self.model_dir = os.path.join(cache_dir, _model_slug(model_name, normalize))
+        self._index = {}    # key -> (shard path, row)
+        self._shards = {}   # shard path -> vectors (loaded lazily)
+        self._load_index()
+
+    def _shard_files(self):
+        return sorted(glob.glob(os.path.join(self.model_dir, "shard_*.npz")))
+
+    def _load_index(self):
+        self._index = {}
+        for f in self._shard_files():
+            try:
+                with np.load(f, allow_pickle=False) as z:
+                    keys = z["keys"].tolist()
+            except Exception:
+                # unreadable / partially written shard: drop it
+                os.remove(f)
+                continue
+            for row, k in enumerate(keys):
+                self._index[k] = (f, row)
+
+    def _vectors(self, shard: str):
+        if shard not in self._shards:
+            with np.load(shard, allow_pickle=False) as z:
+                self._shards[shard] = z["vectors"]
+        return self._shards[shard]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get_many(self, keys):
+        """Return (vectors or None per key). Shards that serve a hit are touched for LRU eviction."""
+        out = [None] * len(keys)
+        used = set()
+        for i, k in enumerate(keys):
+            hit = self._index.get(k)
+            if hit is None:
+                continue
+            shard, row = hit
+            out[i] = self._vectors(shard)[row]
+            used.add(shard)
+        for shard in used:
+            try:
+                os.utime(shard, None)
+            except OSError:
+                pass
+        return out
+
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # keep only first occurrence of keys not already stored
+        first = {}
+        for i, k in enumerate(keys):
+            if k not in self._index and k not in first:
+                first[k] = i
+        if not first:
+            return
+        sel = list(first.values())
+        new_keys = np.asarray(list(first.keys()))
+        new_vecs = vectors[sel]
+        os.makedirs(self.model_dir, exist_ok=True)
+        shard = os.path.join(self.model_dir, f"shard_{time.time_ns():020d}_{os.getpid()}.npz")
+        tmp = shard + ".tmp"
+        with open(tmp, "wb") as fh:
+            np.savez(fh, keys=new_keys, vectors=new_vecs)
+        os.replace(tmp, shard)
+        self._shards[shard] = new_vecs
+        for row, k in enumerate(new_keys.tolist()):
+            self._index[k] = (shard, row)
+        self.evict()
+
+    def size_bytes(self) -> int:
+        total = 0
+        for d in glob.glob(os.path.join(self.cache_dir, "*")):
+            for f in glob.glob(os.path.join(d, "shard_*.npz")):
+                total += os.path.getsize(f)
+        return total
+
+    def evict(self):
+        """Drop least-recently-used shards (across all models) until the store fits max_bytes."""
+        if not self.max_bytes:
+            return
+        shards = []
+        for d in glob.glob(os.path.join(self.cache_dir, "*")):
+            shards.extend(glob.glob(os.path.join(d, "shard_*.npz")))
+        sizes = {f: os.path.getsize(f) for f in shards}
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        for f in sorted(shards, key=os.path.getmtime):
+            if total <= self.max_bytes:
+                break
+            os.remove(f)
+            total -= sizes[f]
+            self._shards.pop(f, None)
+        self._load_index()
+
+    def invalidate(self):
+        invalidate_model(self.cache_dir, self.model_name, self.normalize)
+        self._index = {}
+        self._shards = {}
+
+
+def invalidate_model(cache_dir: str, model_name: str, normalize=None):
+    """Remove cached vectors for one model (both normalize variants when normalize is None)."""
+    flags = (True, False) if normalize is None else (bool(normalize),)
+    for flag in flags:
+        d = os.path.join(cache_dir, _model_slug(model_name, flag))
+        if os.path.isdir(d):
+            shutil.rmtree(d)
@@ -1,23 +1,117 @@
 """
-Embedding helpers using SentenceTransformer (optional).
+Embedding helpers using SentenceTransformer (optional; imported on first load_model call).
 """
-import os
 import numpy as np
-
-try:
-    from sentence_transformers import SentenceTransformer
-except Exception:
-    SentenceTransformer = None
+import pandas as pd
+import config
+from embed_cache import EmbeddingCache, text_key
 
 
 def load_model(model_name: str):
-    if SentenceTransformer is None:
+    # sentence_transformers pulls in torch; import it only when a model is actually needed
+    try:
+        from sentence_transformers import SentenceTransformer
+    except Exception:
         raise ImportError("sentence-transformers is not installed. See requirements.txt")
     model = SentenceTransformer(model_name)
     return model
 
 
-def encode_all(model, tax_paths, em_texts, normalize=True, show_progress_bar=True):
-    tax_emb = model.encode(tax_paths, normalize_embeddings=normalize, show_progress_bar=show_progress_bar)
-    em_emb = model.encode(em_texts, normalize_embeddings=normalize, show_progress_bar=show_progress_bar)
-    return np.asarray(tax_emb), np.asarray(em_emb)
+def _token_lengths(model, texts):
+    tok = getattr(model, "tokenizer", None)
+    if tok is not None:
+        try:
+            return np.array([len(ids) for ids in tok(texts, add_special_tokens=False)["input_ids"]])
+        except Exception:
+            pass
+    return np.array([len(t.split()) for t in texts])
+
+
+class EncodingPool:
+    """CPU worker processes for SentenceTransformer.encode_multi_process, started on first use."""
+
+    def __init__(self, model, workers=None):
+        self.model = model
+        self.workers = int(config.ENCODE_WORKERS if workers is None else workers)
+        self._pool = None
+
+    def usable(self, n_texts):
+        return (self.workers > 1 and n_texts >= config.ENCODE_POOL_MIN_TEXTS
+                and hasattr(self.model, "start_multi_process_pool"))
+
+    def get(self):
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+def _l2_normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def encode_bucketed(model, texts, normalize=True, show_progress_bar=True, pool=None, batch_size=None):
+    """Encode texts sorted by token length, so batches hold similar lengths, then restore the input order.
+
+    With a usable pool, length-ordered chunks are fanned out across its worker processes.
+    """
+    texts = [str(t) for t in texts]
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    batch_size = int(batch_size or config.ENCODE_BATCH_SIZE)
+    order = np.argsort(-_token_lengths(model, texts), kind="stable")
+    sorted_texts = [texts[i] for i in order]
+    if pool is not None and pool.usable(len(texts)):
+        chunk = max(batch_size, int(np.ceil(len(texts) / (pool.workers * 4))))
+        emb = np.asarray(model.encode_multi_process(sorted_texts, pool.get(), batch_size=batch_size, chunk_size=chunk))
+        if normalize:
+            emb = _l2_normalize(emb)
+    else:
+        emb = np.asarray(model.encode(sorted_texts, batch_size=batch_size, normalize_embeddings=normalize,
+                                      show_progress_bar=show_progress_bar))
+    out = np.empty_like(emb)
+    out[order] = emb
+    return out
+
+
+def encode_texts(model, texts, normalize=True, show_progress_bar=True, cache=None, pool=None):
+    """Encode texts, serving hits from `cache` and encoding (then storing) only the misses.
+
+    Repeated strings are encoded once and their vector is shared by every occurrence.
+    """
+    codes, uniq = pd.factorize(pd.Series([str(t) for t in texts], dtype=object))
+    texts = uniq.tolist()
+    if cache is None:
+        emb = encode_bucketed(model, texts, normalize=normalize, show_progress_bar=show_progress_bar, pool=pool)
+        return emb[codes] if len(texts) else emb
+    keys = [text_key(t) for t in texts]
+    found = cache.get_many(keys)
+    miss = [i for i, v in enumerate(found) if v is None]
+    if miss:
+        miss_emb = encode_bucketed(model, [texts[i] for i in miss], normalize=normalize, show_progress_bar=show_progress_bar, pool=pool)
+        cache.put_many([keys[i] for i in miss], miss_emb)
+        for i, v in zip(miss, miss_emb):
+            found[i] = v
+    if not found:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(found).astype(np.float32, copy=False)[codes]
+
+
+def encode_all(model, tax_paths, em_texts, normalize=True, show_progress_bar=True, model_name=None, cache_dir=None, workers=None):
+    cache = None
+    if model_name and config.ENABLE_EMBED_CACHE:
+        cache = EmbeddingCache(cache_dir or config.EMBED_CACHE_DIR, model_name, normalize=normalize,
+                               max_bytes=config.EMBED_CACHE_MAX_BYTES)
+    pool = EncodingPool(model, workers)
+    try:
+        tax_emb = encode_texts(model, tax_paths, normalize=normalize, show_progress_bar=show_progress_bar, cache=cache, pool=pool)
+        em_emb = encode_texts(model, em_texts, normalize=normalize, show_progress_bar=show_progress_bar, cache=cache, pool=pool)
+    finally:
+        pool.close()
+    return tax_emb, em_emb
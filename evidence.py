@@ -6,6 +6,8 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from utils import _clean_desc_text
+from tax_tree import PathTree
+from data import read_sheet, workbook_sheet_names
 from config import (
     EVIDENCE_MATCH_MODE, EVIDENCE_COVERAGE_MIN, EVIDENCE_MIN_MATCHED_TERMS,
     EVIDENCE_FALLBACK_COSINE, EVIDENCE_MAX_TERMS_PER_PATH,
@@ -72,12 +74,80 @@ def _term_in_desc(term: str, desc_norm: str, path: str = "") -> bool:
     return False
 
 
+def _trie_pattern(words):
+    """Regex alternation shaped as a trie; greedy optional branches make it match the longest word at a position."""
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return emit(trie)
+
+
+class TermMatcher:
+    """Every expected term of a run (plus its alias candidates) compiled into one pattern.
+
+    Matching keeps the substring semantics of _term_in_desc: a term matches when any of its
+    candidates occurs in the description. The pattern reports the longest candidate starting at
+    each position; shorter candidates contained in it are implied.
+    """
+
+    def __init__(self, terms):
+        self.cand_terms = {}
+        self.always = set()
+        for t in terms:
+            if not t:
+                continue
+            for c in [t] + _term_candidates(t):
+                if c:
+                    self.cand_terms.setdefault(c, set()).add(t)
+                else:
+                    self.always.add(t)
+        body = _trie_pattern(self.cand_terms)
+        self.regex = re.compile("(?=(" + body + "))") if body else None
+        self._implied = {}
+
+    @classmethod
+    def from_cache(cls, path_term_cache: dict):
+        return cls({t for terms in path_term_cache.values() for t in terms})
+
+    def _implied_terms(self, found: str):
+        hit = self._implied.get(found)
+        if hit is None:
+            hit = set()
+            n = len(found)
+            for i in range(n):
+                for j in range(i + 1, n + 1):
+                    hit |= self.cand_terms.get(found[i:j], set())
+            self._implied[found] = hit
+        return hit
+
+    def match(self, desc_norm: str) -> set:
+        """All terms matched in a normalized description, in a single scan."""
+        out = set(self.always)
+        if self.regex is None or not desc_norm:
+            return out
+        for found in {m.group(1) for m in self.regex.finditer(desc_norm)}:
+            if found:
+                out |= self._implied_terms(found)
+        return out
+
+
 def build_taxonomy_term_set(taxon_xlsx_path: str, use_keywords_original=True):
     terms = set()
     try:
-        xls = pd.ExcelFile(taxon_xlsx_path)
-        if use_keywords_original and "Keywords_Original" in xls.sheet_names:
-            kw = pd.read_excel(xls, sheet_name="Keywords_Original")
+        sheet_names = workbook_sheet_names(taxon_xlsx_path)
+        if use_keywords_original and "Keywords_Original" in sheet_names:
+            kw = read_sheet(taxon_xlsx_path, "Keywords_Original")
             kw_col = next((c for c in kw.columns if "keyword" in c.lower()), None)
             if kw_col:
                 for k in kw[kw_col].dropna().astype(str):
@@ -85,8 +155,8 @@ def build_taxonomy_term_set(taxon_xlsx_path: str, use_keywords_original=True):
                     if nk:
                         terms.add(nk)
         # Combined_Taxonomy sheet fallback
-        if "Combined_Taxonomy" in xls.sheet_names:
-            ct = pd.read_excel(xls, sheet_name="Combined_Taxonomy")
+        if "Combined_Taxonomy" in sheet_names:
+            ct = read_sheet(taxon_xlsx_path, "Combined_Taxonomy")
             for col in [c for c in ct.columns if c.lower() in ("path","name")]:
                 for v in ct[col].dropna().astype(str):
                     nv = _normalize_term(v)
@@ -97,31 +167,17 @@ def build_taxonomy_term_set(taxon_xlsx_path: str, use_keywords_original=True):
     return terms
 
 
-def _split_path_any(path: str):
-    p = str(path)
-    if ">" in p:
-        parts = [x.strip() for x in p.split(">") if x.strip()]
-    elif "/" in p:
-        parts = [x.strip() for x in p.split("/") if x.strip()]
-    else:
-        parts = [p.strip()] if p.strip() else []
-    return parts
+def _parent_path(path: str, tree: PathTree):
+    return tree.parent_path(tree.add(path))
 
 
-def _parent_path(path: str):
-    parts = _split_path_any(path)
-    if len(parts) <= 1: return None
-    return " > ".join(parts[:-1])
-
-
-def prepare_expected_terms_cache(assign_df: pd.DataFrame, taxonomy_xlsx: str):
-    taxonomy_terms = build_taxonomy_term_set(taxonomy_xlsx)
+def expected_terms_for(paths, taxonomy_terms, tree: PathTree = None):
+    """{path: expected evidence terms} for the given consolidated paths (UNCAT skipped)."""
+    tree = PathTree() if tree is None else tree
     PATH_TERM_CACHE = {}
-    all_paths = assign_df["Consolidated_Path"].dropna().unique().tolist()
-    for p in list(all_paths):
+    for p in list(paths):
         if p != "UNCAT":
-            parts = _split_path_any(p)
-            leaf = parts[-1] if parts else ""
+            leaf = tree.leaf(tree.add(p)) or ""
             candidates = []
             leaf_n = _normalize_term(leaf)
             for t in re.findall(r"[a-z0-9]+", leaf_n):
@@ -139,71 +195,136 @@ def prepare_expected_terms_cache(assign_df: pd.DataFrame, taxonomy_xlsx: str):
     return PATH_TERM_CACHE
 
 
-def apply_evidence_gate(assign_df: pd.DataFrame, em_df: pd.DataFrame, path_term_cache: dict):
-    desc_series = em_df.set_index(em_df.columns[0])[em_df.columns[1]] if False else None
-    # build normalized desc map
+def prepare_expected_terms_cache(assign_df: pd.DataFrame, taxonomy_xlsx: str, tree: PathTree = None):
+    taxonomy_terms = build_taxonomy_term_set(taxonomy_xlsx)
+    return expected_terms_for(assign_df["Consolidated_Path"].dropna().unique().tolist(), taxonomy_terms, tree)
+
+
+def _matched_terms(inc, term_lists, found_pairs):
+    """Per row: how many of its expected terms were found for its incident, and those terms ' | '-joined."""
+    n = len(inc)
+    pairs = pd.DataFrame({"row": np.arange(n), "inc": np.asarray(inc, dtype=object), "term": term_lists})
+    pairs = pairs.explode("term").dropna(subset=["term"])
+    # inner merge keeps left order, so matched terms stay in expected-term order
+    hits = pairs.merge(found_pairs, on=["inc", "term"], how="inner")
+    rows = hits["row"].to_numpy(dtype=np.int64)
+    count = np.bincount(rows, minlength=n)
+    joined = np.full(n, "", dtype=object)
+    # hits are few per row (EVIDENCE_MAX_TERMS_PER_PATH); a linear pass beats a groupby string agg
+    for r, t in zip(rows.tolist(), hits["term"].tolist()):
+        joined[r] = t if not joined[r] else joined[r] + " | " + t
+    return count, joined
+
+
+def apply_evidence_gate(assign_df: pd.DataFrame, em_df: pd.DataFrame, path_term_cache: dict, matcher: TermMatcher = None,
+                        tree: PathTree = None):
+    # raw description per incident (first column is the id)
     desc_map_raw = dict(zip(em_df.iloc[:,0].tolist(), em_df.iloc[:, em_df.columns.get_loc('_emars_text_') if '_emars_text_' in em_df.columns else 1].astype(str).tolist()))
-    desc_map_norm = {k: _normalize_term(_clean_desc_text(v)) for k, v in desc_map_raw.items()}
-
-    ev_rows = []
-    for _, r in assign_df.iterrows():
-        inc_id = r["Accident ID"]
-        path = str(r.get("Consolidated_Path", r.get("Final_Category_Path", "UNCAT")))
-        cosv = float(r.get("Cosine", 0.0))
-        if path == "UNCAT":
-            ev_rows.append({**r, "Evidence_Pass": True, "Evidence_Reason": "pre_uncat"})
-            continue
-        expected_terms = path_term_cache.get(path, [])
-        desc_n = desc_map_norm.get(inc_id, "")
-        matched = [t for t in expected_terms if _term_in_desc(t, desc_n, path=path)]
-        exp_n = len(expected_terms)
-        cov = (len(matched) / exp_n) if exp_n > 0 else np.nan
-        if exp_n == 0:
-            ev_pass = float(cosv) >= float(EVIDENCE_FALLBACK_COSINE)
-            reason = "fallback_cosine" if ev_pass else "reject_fallback_cosine"
-        else:
-            ev_pass = (len(matched) >= int(EVIDENCE_MIN_MATCHED_TERMS)) and (float(cov) >= float(EVIDENCE_COVERAGE_MIN))
-            reason = "pass_expected_terms" if ev_pass else "reject_expected_terms"
-        # parent backoff
-        chosen_path = path
-        chosen = {"expected_terms": expected_terms, "matched": matched, "cov": cov, "ev_pass": ev_pass}
-        if (not ev_pass) and ENABLE_PARENT_BACKOFF:
-            pp = _parent_path(path)
-            if pp:
-                p_expected = path_term_cache.get(pp, [])
-                p_matched = [t for t in p_expected if _term_in_desc(t, desc_n, path=pp)]
-                p_exp_n = len(p_expected)
-                p_cov = (len(p_matched) / p_exp_n) if p_exp_n > 0 else np.nan
-                p_pass = ((p_exp_n > 0 and len(p_matched) >= int(PARENT_BACKOFF_MIN_MATCHED_TERMS) and float(p_cov) >= float(PARENT_BACKOFF_COVERAGE_MIN))
-                          or (p_exp_n == 0 and float(cosv) >= float(PARENT_BACKOFF_MIN_COSINE)))
-                if p_pass:
-                    chosen_path = pp
-                    reason = "accept_parent_backoff"
-                    chosen = {"expected_terms": p_expected, "matched": p_matched, "cov": p_cov, "ev_pass": p_pass}
-        ev_rows.append({
-            **r,
-            "Final_Category_Path": chosen_path,
-            "Consolidated_Path": chosen_path,
-            "Evidence_Expected_Terms": " | ".join(chosen.get("expected_terms", [])),
-            "Evidence_Matched_Terms": " | ".join(chosen.get("matched", [])),
-            "Evidence_Matched_Count": len(chosen.get("matched", [])),
-            "Evidence_Expected_Count": chosen.get("exp_n", len(chosen.get("expected_terms", []))),
-            "Evidence_Coverage": chosen.get("cov", 0),
-            "Evidence_Pass": bool(chosen.get("ev_pass", False)),
-            "Evidence_Reason": reason,
-            "Description_Full": desc_map_raw.get(inc_id, ""),
-        })
-    ev = pd.DataFrame(ev_rows)
+
+    ev = assign_df.reset_index(drop=True).copy()
+    n = len(ev)
+    inc = ev["Accident ID"]
+    if "Consolidated_Path" in ev.columns:
+        path = ev["Consolidated_Path"].astype(str)
+    elif "Final_Category_Path" in ev.columns:
+        path = ev["Final_Category_Path"].astype(str)
+    else:
+        path = pd.Series(["UNCAT"] * n)
+    cosv = ev["Cosine"].astype(float).to_numpy() if "Cosine" in ev.columns else np.zeros(n)
+    work = (path != "UNCAT").to_numpy()
+
+    # matched-term set per incident: one scan of each normalized description
+    # callers gating many small batches against one cache pass a prebuilt matcher
+    matcher = matcher or TermMatcher.from_cache(path_term_cache)
+    work_inc = pd.unique(inc[work])
+    found = {k: matcher.match(_normalize_term(_clean_desc_text(desc_map_raw[k])) if k in desc_map_raw else "") for k in work_inc}
+    found_pairs = pd.DataFrame([(k, t) for k, terms in found.items() for t in terms], columns=["inc", "term"]).astype(object)
+
+    # per unique path: expected terms, parent path and the parent's expected terms
+    upaths = pd.unique(path[work])
+    expected_of = {p: list(path_term_cache.get(p, [])) for p in upaths}
+    tree = PathTree() if tree is None else tree
+    parent_of = {p: _parent_path(p, tree) for p in upaths}
+    p_expected_of = {p: list(path_term_cache.get(pp, [])) if pp else [] for p, pp in parent_of.items()}
+
+    wpath = path[work]
+    w_inc = inc[work].to_numpy()
+    w_cos = cosv[work]
+    expected = wpath.map(expected_of)
+    exp_n = expected.map(len).to_numpy(copy=True)
+    exp_str = expected.map(" | ".join).to_numpy(dtype=object)
+    m_n, m_str = _matched_terms(w_inc, expected.to_numpy(dtype=object), found_pairs)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = np.where(exp_n > 0, m_n / np.maximum(exp_n, 1), np.nan)
+    fallback = exp_n == 0
+    ev_pass = np.where(fallback, w_cos >= float(EVIDENCE_FALLBACK_COSINE),
+                       (m_n >= int(EVIDENCE_MIN_MATCHED_TERMS)) & (cov >= float(EVIDENCE_COVERAGE_MIN)))
+    reason = np.where(fallback, np.where(ev_pass, "fallback_cosine", "reject_fallback_cosine"),
+                      np.where(ev_pass, "pass_expected_terms", "reject_expected_terms")).astype(object)
+    chosen_path = wpath.to_numpy(dtype=object)
+
+    # parent backoff
+    if ENABLE_PARENT_BACKOFF:
+        pp = wpath.map(parent_of)
+        need = (~ev_pass) & pp.notna().to_numpy()
+        if need.any():
+            p_expected = wpath[need].map(p_expected_of)
+            p_exp_n = p_expected.map(len).to_numpy()
+            p_m_n, p_m_str = _matched_terms(w_inc[need], p_expected.to_numpy(dtype=object), found_pairs)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                p_cov = np.where(p_exp_n > 0, p_m_n / np.maximum(p_exp_n, 1), np.nan)
+            p_pass = (((p_exp_n > 0) & (p_m_n >= int(PARENT_BACKOFF_MIN_MATCHED_TERMS)) & (p_cov >= float(PARENT_BACKOFF_COVERAGE_MIN)))
+                      | ((p_exp_n == 0) & (w_cos[need] >= float(PARENT_BACKOFF_MIN_COSINE))))
+            idx = np.nonzero(need)[0][p_pass]
+            chosen_path[idx] = pp.to_numpy(dtype=object)[need][p_pass]
+            reason[idx] = "accept_parent_backoff"
+            exp_str[idx] = p_expected.map(" | ".join).to_numpy(dtype=object)[p_pass]
+            m_str[idx] = p_m_str[p_pass]
+            m_n[idx] = p_m_n[p_pass]
+            exp_n[idx] = p_exp_n[p_pass]
+            cov[idx] = p_cov[p_pass]
+            ev_pass[idx] = True
+
+    work_index = np.nonzero(work)[0]
+
+    def _spread(values, fill=np.nan):
+        """Values for the gated rows; pre-UNCAT rows get `fill` (missing, like the row-wise version)."""
+        out = np.full(n, fill, dtype=object)
+        out[work_index] = values
+        # re-infer the dtype the way a frame built from row dicts would
+        return pd.Series(out.tolist(), dtype=None)
+
+    new_cols = {}
+    if work.any():
+        for col in ("Final_Category_Path", "Consolidated_Path"):
+            if col in ev.columns:
+                ev.loc[work, col] = chosen_path
+            else:
+                new_cols[col] = _spread(chosen_path)
+        new_cols["Evidence_Expected_Terms"] = _spread(exp_str)
+        new_cols["Evidence_Matched_Terms"] = _spread(m_str)
+        new_cols["Evidence_Matched_Count"] = _spread(m_n)
+        new_cols["Evidence_Expected_Count"] = _spread(exp_n)
+        new_cols["Evidence_Coverage"] = _spread(cov)
+    pass_reason = {
+        "Evidence_Pass": _spread(ev_pass.astype(bool), True),
+        "Evidence_Reason": _spread(reason, "pre_uncat"),
+    }
+    # column order follows the first row, as a frame built from row dicts would
+    new_cols = {**pass_reason, **new_cols} if n and not work[0] else {**new_cols, **pass_reason}
+    if work.any():
+        new_cols["Description_Full"] = _spread(np.array([desc_map_raw.get(k, "") for k in w_inc], dtype=object))
+    for col, values in new_cols.items():
+        ev[col] = values
+
     fail_mask = (ev["Consolidated_Path"] != "UNCAT") & (ev["Evidence_Pass"] == False)
     
     # Downgrade them to UNCAT instead of dropping them
     ev.loc[fail_mask, "Consolidated_Path"] = "UNCAT"
     ev.loc[fail_mask, "Final_Category_Path"] = "UNCAT"
     ev.loc[fail_mask, "Evidence_Reason"] = ev.loc[fail_mask, "Evidence_Reason"] + " -> downgraded_to_uncat"
-    # Keep ALL rows
-    supported = ev.copy()
-    # filter supported
-    supported = ev[(ev["Consolidated_Path"] == "UNCAT") | (ev["Evidence_Pass"] == True)].copy()
-    supported = supported.sort_values(["Accident ID", "Cosine"], ascending=[True, False]).copy()
+    # Keep ALL rows (failures were downgraded above)
+    supported = ev[(ev["Consolidated_Path"] == "UNCAT") | (ev["Evidence_Pass"] == True)]
+    supported = supported.sort_values(["Accident ID", "Cosine"], ascending=[True, False])
     supported["Rank"] = supported.groupby("Accident ID").cumcount() + 1
     return supported
@@ -1,11 +1,16 @@
-import pandas as pd
+import os
 import re
+import json
+import hashlib
+import pandas as pd
 
 # --- CONFIGURATION ---
 # Use the output from the last step (or your original file if you want a fresh start)
 INPUT_FILE = "Taxonomy_With_Chemicals.xlsx" 
 OUTPUT_FILE = "Taxonomy_Major_Pools.xlsx"
 SHEET_NAME = "Combined_Taxonomy"
+# Path -> grouped path of the last run, so only new/changed paths are classified again
+STATE_FILE = OUTPUT_FILE + ".pools.json"
 
 # --- THE MASTER CLASSIFICATION MAP ---
 # (Order matters: We check these from top to bottom)
@@ -65,42 +70,102 @@ MASTER_MAP = {
 def clean_path(p):
     return str(p).replace("/", " > ").replace(" >> ", " > ").strip()
 
-def classify_node(path):
-    p = clean_path(path)
-    parts = [x.strip() for x in p.split(">")]
-    
-    # We classify based on the LEAF (the specific item)
-    leaf = parts[-1]
-    leaf_lower = leaf.lower()
-    
-    # Check against our Master Map
-    for pool, keywords in MASTER_MAP.items():
-        for kw in keywords:
+class PoolMatcher:
+    """MASTER_MAP compiled once: one word-bounded alternation per pool, tried in map order (first pool wins)."""
+
+    def __init__(self, master_map=None):
+        master_map = MASTER_MAP if master_map is None else master_map
+        self.pools = []
+        for pool, keywords in master_map.items():
+            # longest first, so phrases ("control room") are tried before their words
+            kws = sorted(set(keywords), key=len, reverse=True)
+            if kws:
+                self.pools.append((pool, re.compile(r'\b(?:' + "|".join(re.escape(kw) for kw in kws) + r')\b')))
+
+    def pool_of(self, leaf_lower):
+        for pool, rx in self.pools:
             # Word boundary check (matches "oil" but not "boil")
-            if re.search(r'\b' + re.escape(kw) + r'\b', leaf_lower):
-                
-                # Check if the path ALREADY starts with this Pool
-                # e.g. "Equipment > Pumps" -> Don't change it to "Equipment > Equipment > Pumps"
-                if parts[0] == pool:
-                    return p
-                
-                # If the path is just the leaf (e.g. "Pump"), put it in the Pool
-                if len(parts) == 1:
-                    return f"{pool} > {leaf}"
-                
-                # If the path has structure (e.g. "Pumps > Centrifugal"), put the Pool at the top
-                # Result: "Equipment > Pumps > Centrifugal"
-                
-                # Heuristic: If the current root is NOT one of our pools, replace it or prepend?
-                # Let's PREPEND the pool to group everything together.
-                return f"{pool} > {p}"
-
-    # If no match, it remains an "Individual" (Unclassified relative to pools)
-    return p # Or return f"Individuals > {p}" if you want to group them too
-
-def run():
+            if rx.search(leaf_lower):
+                return pool
+        return None
+
+    def classify(self, path):
+        p = clean_path(path)
+        parts = [x.strip() for x in p.split(">")]
+
+        # We classify based on the LEAF (the specific item)
+        leaf = parts[-1]
+        pool = self.pool_of(leaf.lower())
+
+        # If no match, it remains an "Individual" (Unclassified relative to pools)
+        if pool is None:
+            return p # Or return f"Individuals > {p}" if you want to group them too
+
+        # Check if the path ALREADY starts with this Pool
+        # e.g. "Equipment > Pumps" -> Don't change it to "Equipment > Equipment > Pumps"
+        if parts[0] == pool:
+            return p
+
+        # If the path is just the leaf (e.g. "Pump"), put it in the Pool
+        if len(parts) == 1:
+            return f"{pool} > {leaf}"
+
+        # If the path has structure (e.g. "Pumps > Centrifugal"), PREPEND the pool to group everything together
+        # Result: "Equipment > Pumps > Centrifugal"
+        return f"{pool} > {p}"
+
+    def classify_paths(self, paths, known=None):
+        """Grouped path for every entry of `paths`; each distinct path is classified once, `known` results are reused."""
+        known = {} if known is None else known
+        out = {}
+        for p in pd.unique(pd.Series(paths, dtype=object)):
+            key = str(p)
+            out[key] = known[key] if key in known else self.classify(p)
+        return [out[str(p)] for p in paths], out
+
+_MATCHER = None
+
+def classify_node(path):
+    global _MATCHER
+    if _MATCHER is None:
+        _MATCHER = PoolMatcher()
+    return _MATCHER.classify(path)
+
+def _map_fingerprint():
+    return hashlib.sha1(json.dumps(MASTER_MAP, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _file_fingerprint(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _load_state():
+    """(input fingerprint, {path: grouped path}) of the last run with the current MASTER_MAP."""
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("map") == _map_fingerprint():
+            return state.get("input"), state.get("paths", {})
+    except Exception:
+        pass
+    return None, {}
+
+def _save_state(input_fp, paths):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"map": _map_fingerprint(), "input": input_fp, "paths": paths}, f)
+    os.replace(tmp, STATE_FILE)
+
+def run(incremental=True):
     print(f"Reading {INPUT_FILE}...")
     try:
+        input_fp = _file_fingerprint(INPUT_FILE)
+        prev_fp, known = _load_state() if incremental else (None, {})
+        if prev_fp == input_fp and os.path.exists(OUTPUT_FILE):
+            print(f"{OUTPUT_FILE} is up to date (input and MASTER_MAP unchanged)")
+            return
         df = pd.read_excel(INPUT_FILE, sheet_name=SHEET_NAME)
     except Exception as e:
         print(f"Error: {e}")
@@ -109,20 +174,17 @@ def run():
     path_col = next((c for c in df.columns if "path" in c.lower()), "Taxonomy_Path")
     print(f"Processing column: {path_col}")
     
-    # 1. Apply Classification
-    original_paths = df[path_col].tolist()
-    df[path_col] = df[path_col].apply(classify_node)
-    new_paths = df[path_col].tolist()
+    # 1. Apply Classification (whole column at once; paths seen in the last run are reused)
+    new_paths, results = PoolMatcher().classify_paths(df[path_col].tolist(), known)
+    df[path_col] = new_paths
+    reused = sum(1 for p in results if p in known)
+    print(f"Distinct paths: {len(results)} ({reused} unchanged since the last run, {len(results) - reused} classified)")
     
     # 2. Identify "Individuals" (Nodes that didn't get moved into a Pool)
     # We check if the new path starts with one of our Pool names
     pool_names = list(MASTER_MAP.keys())
-    
-    individuals = []
-    for p in new_paths:
-        root = p.split(">")[0].strip()
-        if root not in pool_names:
-            individuals.append(p)
+    roots = df[path_col].astype(str).str.split(">").str[0].str.strip()
+    individuals = df.loc[~roots.isin(pool_names), path_col].tolist()
             
     # 3. Report Results
     unique_inds = sorted(list(set(individuals)))
@@ -139,7 +201,9 @@ def run():
     
     # 4. Save
     df.to_excel(OUTPUT_FILE, sheet_name=SHEET_NAME, index=False)
+    _save_state(input_fp, results)
     print(f"Saved grouped taxonomy to: {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    import sys
+    run(incremental="--full" not in sys.argv[1:])
@@ -0,0 +1,220 @@
+"""
+Per-stage instrumentation for run_all: wall/CPU time, RSS at entry and the stage's own peak RSS,
+rows in/out and unique paths, optional cProfile capture of one stage, written as a JSON run report.
+
+A stage's peak comes from the kernel high-water mark on Linux (reset through /proc/self/clear_refs at
+stage entry, read as VmHWM at exit); elsewhere a thread samples the RSS while the stage runs (psutil).
+
+Side effect: the reset applies to the whole process, so after a stage has run, getrusage().ru_maxrss and
+VmHWM only cover the time since the last stage entry. peak_rss_mb() folds in the mark read before each
+reset and stays the process-lifetime peak; use it instead of ru_maxrss.
+"""
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import threading
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+_SAMPLE_S = 0.01
+_peak_before_reset = 0.0   # highest VmHWM read just before a reset of the mark
+
+# first column present is counted as the stage's "unique paths"
+_PATH_COLUMNS = ("Consolidated_Path_Render", "Consolidated_Path", "Final_Category_Path")
+
+
+def peak_rss_mb():
+    """Process peak resident set size in MB over its lifetime, including before any StageMemory reset
+    (None where neither /proc nor the resource module is available)."""
+    hwm, = _status_mb("VmHWM")
+    if hwm is not None:
+        return max(hwm, _peak_before_reset)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _status_mb(*fields):
+    """Fields of /proc/self/status (kB values) in MB, None each when unreadable."""
+    out = dict.fromkeys(fields)
+    try:
+        with open(_STATUS, "r", encoding="ascii") as f:
+            for line in f:
+                key, _, val = line.partition(":")
+                if key in out:
+                    out[key] = round(int(val.split()[0]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return [out[k] for k in fields]
+
+
+def rss_mb():
+    """Current resident set size in MB (None when neither /proc nor psutil is available)."""
+    rss, = _status_mb("VmRSS")
+    if rss is None and psutil is not None:
+        rss = round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    return rss
+
+
+def _reset_hwm():
+    global _peak_before_reset
+    hwm, = _status_mb("VmHWM")
+    if hwm is None:
+        return False
+    _peak_before_reset = max(_peak_before_reset, hwm)
+    try:
+        with open(_CLEAR_REFS, "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+_ACTIVE = []   # open StageMemory blocks, outermost first (a reset inside a nested block must not lose the outer peak)
+
+
+class StageMemory:
+    """RSS at entry/exit and peak RSS of one block, as `with StageMemory() as mem: ...; mem.record()`."""
+
+    def __init__(self):
+        self.start = self.end = self.peak = None
+        self._hwm = False
+        self._stop = None
+        self._thread = None
+
+    def _fold_hwm(self):
+        hwm, = _status_mb("VmHWM")
+        if hwm is not None:
+            for m in _ACTIVE:
+                if m._hwm:
+                    m.peak = hwm if m.peak is None else max(m.peak, hwm)
+
+    def _sample(self):
+        while not self._stop.wait(_SAMPLE_S):
+            rss = rss_mb()
+            if rss is not None:
+                self.peak = max(self.peak, rss)
+
+    def __enter__(self):
+        self._fold_hwm()
+        self.start = rss_mb()
+        self._hwm = self.start is not None and _reset_hwm()
+        if not self._hwm and self.start is not None:
+            self.peak = self.start
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+            self._thread.start()
+        _ACTIVE.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._fold_hwm()
+        _ACTIVE.remove(self)
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        self.end = rss_mb()
+        if self.peak is not None and self.end is not None:
+            self.peak = max(self.peak, self.end)
+        return False
+
+    def record(self):
+        """rss_start_mb, peak_rss_mb (this block only) and rss_delta_mb (exit - entry)."""
+        delta = round(self.end - self.start, 1) if self.start is not None and self.end is not None else None
+        return {"rss_start_mb": self.start, "peak_rss_mb": self.peak, "rss_delta_mb": delta}
+
+
+class StageRecord(dict):
+    def set_output(self, df):
+        """Record rows out and unique paths of a stage's output frame."""
+        if df is None:
+            return
+        self["rows_out"] = int(len(df))
+        col = next((c for c in _PATH_COLUMNS if c in getattr(df, "columns", ())), None)
+        if col is not None:
+            self["unique_paths"] = int(df[col].nunique())
+
+
+class RunReport:
+    """Collects one StageRecord per stage; `hook(event, payload)` is called after each stage ("stage")
+    and once with the full report ("run") when the report is written."""
+
+    def __init__(self, profile_stage=None, hook=None, profile_dir=None, top_n=25):
+        self.profile_stage = profile_stage or None
+        self.hook = hook
+        self.profile_dir = profile_dir
+        self.top_n = top_n
+        self.started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.stages = []
+        self.meta = {}
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        rec = StageRecord(name=name)
+        if rows_in is not None:
+            rec["rows_in"] = int(rows_in)
+        prof = cProfile.Profile() if name == self.profile_stage else None
+        mem = StageMemory()
+        try:
+            with mem:
+                w, c = time.perf_counter(), time.process_time()
+                if prof:
+                    prof.enable()
+                try:
+                    yield rec
+                finally:
+                    if prof:
+                        prof.disable()
+                    rec["wall_s"] = round(time.perf_counter() - w, 4)
+                    rec["cpu_s"] = round(time.process_time() - c, 4)
+        finally:
+            rec.update(mem.record())
+            if prof:
+                rec["profile"] = self._dump_profile(name, prof)
+            self.stages.append(rec)
+            if self.hook:
+                self.hook("stage", dict(rec))
+
+    def _dump_profile(self, name, prof):
+        out = {}
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            out["file"] = os.path.join(self.profile_dir, f"profile_{name}.prof")
+            prof.dump_stats(out["file"])
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(self.top_n)
+        out["top"] = buf.getvalue()
+        return out
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 4),
+            "peak_rss_mb": peak_rss_mb(),
+            **self.meta,
+            "stages": self.stages,
+        }
+
+    def write(self, path):
+        report = self.to_dict()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        if self.hook:
+            self.hook("run", report)
+        return report
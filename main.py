@@ -7,53 +7,207 @@ import pandas as pd
 import config
 from data import load_emars, load_taxonomy
 from embeddings import load_model, encode_all
+from emb_store import save_matrix, open_matrix
 from assign import assign_hierarchical
 from consolidate import consolidate_and_disambiguate
 from evidence import prepare_expected_terms_cache, apply_evidence_gate
 from render import collapse_sparse_children, depth_aware_render, export_graph
+from state import RunState, run_fingerprint, text_hashes
+from utils import unique_texts
+from tax_tree import PathTree
+from instrument import RunReport
+from writer import OutputWriter, OUTPUT_NAMES
+from checkpoint import CheckpointStore, stage_fingerprints, resolve_stages
 
 
-def run_all(save_dir: str = None):
-    save_dir = save_dir or os.getcwd()
-    print(f"Working directory: {save_dir}")
+def _persist_embeddings(tax_paths, tax_emb, ids, em_emb, text_index, hashes):
+    """Write both matrices to EMBED_STORE_DIR and hand back memory-mapped views of them.
+
+    The incidents sidecar records each id's text hash (state.text_hashes) so readers can spot stale rows.
+    """
+    d, dtype = config.EMBED_STORE_DIR, config.EMBED_STORE_DTYPE
+    meta = {"model": config.MODEL_NAME}
+    save_matrix(d, "taxonomy", tax_emb, tax_paths, dtype=dtype, meta=meta)
+    save_matrix(d, "incidents", em_emb, ids, dtype=dtype, row_of=text_index, meta={**meta, "text_sha1": [hashes[k] for k in ids]})
+    print(f"Saved {dtype} embedding matrices to {d}")
+    return open_matrix(d, "taxonomy"), open_matrix(d, "incidents")
 
-    # 1. Load
-    em, id_col, title_col, desc_col = load_emars(config.EMARS_XLSX)
-    tx, tax_path_col, tax_paths = load_taxonomy(config.TAXON_XLSX)
-    print(f"Loaded emars: {len(em)} rows, taxonomy paths: {len(tax_paths)}")
 
-    # 2. Model + embeddings
+def _encode(em, id_col, tax_paths, persist=False):
+    """(tax_emb, em_emb, text_index) for the incidents in `em`; em_emb has one row per distinct text when deduplicating."""
     try:
         model = load_model(config.MODEL_NAME)
     except Exception as e:
         raise RuntimeError("Failed to load embedding model. Install sentence-transformers and try again.")
-    tax_emb, em_emb = encode_all(model, tax_paths, em["_emars_text_"].tolist())
-
-    # 3. Assignment
-    assign_raw = assign_hierarchical(em=em, id_col=id_col, tax_paths=tax_paths, em_emb=em_emb, tax_emb=tax_emb)
-    assign_raw.to_csv(os.path.join(save_dir, "eMARS_taxonomy_assignment_raw.csv"), index=False)
-    print("Saved raw assignment CSV")
-
-    # 4. Consolidation
-    assign = consolidate_and_disambiguate(assign_raw, em, id_col)
-    assign.to_csv(os.path.join(save_dir, "eMARS_assignment_consolidated.csv"), index=False)
-    print("Saved consolidated assignment CSV")
-
-    # 5. Evidence
-    path_term_cache = prepare_expected_terms_cache(assign, config.TAXON_XLSX)
-    assign_supported = apply_evidence_gate(assign, em, path_term_cache)
-    assign_supported.to_csv(os.path.join(save_dir, "output_evidence_locked.csv"), index=False)
-    print("Saved evidence-locked CSV")
-
-    # 6. Collapse sparse children and render
-    assign_collapsed = collapse_sparse_children(assign_supported)
-    assign_rendered = depth_aware_render(assign_collapsed)
-    assign_rendered.to_csv(os.path.join(save_dir, "eMARS_assignment_with_render.csv"), index=False)
-    print("Saved rendered assignment CSV")
-
-    # 7. Graph export (dot + optional pdf)
-    dot, pdf = export_graph(assign_rendered)
-    print(f"Graph files: {dot}, {pdf}")
+    texts, text_index = em["_emars_text_"].tolist(), None
+    if config.DEDUP_TEXTS:
+        texts, text_index = unique_texts(texts)
+        print(f"Dedup: {len(em)} incidents -> {len(texts)} distinct texts (ratio {len(texts) / max(len(em), 1):.3f})")
+    tax_emb, em_emb = encode_all(model, tax_paths, texts, model_name=config.MODEL_NAME)
+    if persist:
+        tax_emb, em_emb = _persist_embeddings(tax_paths, tax_emb, em[id_col].tolist(), em_emb, text_index, text_hashes(em, id_col))
+    return tax_emb, em_emb, text_index
+
+
+# report stage name for each checkpointed stage
+_REPORT_NAMES = {"embeddings": "encode", "raw": "assign", "consolidated": "consolidate", "evidence": "evidence", "rendered": "render"}
+
+
+class _Stages:
+    """Runs stages inside report records, reusing and saving checkpoints when a store is given."""
+
+    def __init__(self, report, store=None, force=(), wanted=None):
+        self.report = report
+        self.store = store
+        self.force = set(force)
+        self.wanted = wanted
+
+    def wants(self, name):
+        return self.wanted is None or name in self.wanted
+
+    def cached(self, name):
+        if self.store is None or name in self.force:
+            return None
+        return self.store.load(name)
+
+    def run(self, name, compute, rows_in=None, cached=None):
+        with self.report.stage(_REPORT_NAMES[name], rows_in=rows_in) as st:
+            obj = cached if cached is not None else self.cached(name)
+            if obj is not None:
+                st["checkpoint"] = "reused"
+            else:
+                obj = compute()
+                if self.store is not None:
+                    self.store.save(name, obj)
+                    st["checkpoint"] = "saved"
+            if isinstance(obj, tuple):
+                st["rows_out"] = len(obj[1])
+            else:
+                st.set_output(obj)
+        return obj
+
+
+def _assign_and_consolidate(em, id_col, tax_paths, stages, tree, persist=False):
+    """Per-incident stages (encode -> assign -> consolidate) for the incidents in `em`."""
+    if not stages.wants("raw"):
+        stages.run("embeddings", lambda: _encode(em, id_col, tax_paths, persist), rows_in=len(em))
+        return None, None
+    raw = stages.cached("raw")
+    if raw is None:
+        tax_emb, em_emb, text_index = stages.run("embeddings", lambda: _encode(em, id_col, tax_paths, persist), rows_in=len(em))
+    assign_raw = stages.run("raw", lambda: assign_hierarchical(em=em, id_col=id_col, tax_paths=tax_paths, em_emb=em_emb, tax_emb=tax_emb, tree=tree,
+                                                                text_index=text_index), rows_in=len(em), cached=raw)
+    if not stages.wants("consolidated"):
+        return assign_raw, None
+    assign = stages.run("consolidated", lambda: consolidate_and_disambiguate(assign_raw, em, id_col, tree=tree), rows_in=len(assign_raw))
+    return assign_raw, assign
+
+
+def _order_by_incident(df, ids):
+    pos = {k: i for i, k in enumerate(ids)}
+    key = df["Accident ID"].map(pos)
+    return df.iloc[key.argsort(kind="stable")].reset_index(drop=True)
+
+
+def run_all(save_dir: str = None, incremental: bool = False, state_dir: str = None, profile_stage: str = None, report_hook=None,
+            resume_from: str = None, only=None):
+    """Run the pipeline and write its CSVs plus a JSON run report (config.RUN_REPORT_FILE) to save_dir.
+
+    profile_stage names a stage to capture with cProfile; report_hook(event, payload) receives each
+    stage record ("stage") and the final report ("run").
+
+    With checkpoints (config.ENABLE_CHECKPOINTS, or resume_from/only given) each stage of
+    checkpoint.STAGE_ORDER reuses its stored output while the fingerprint matches. resume_from recomputes
+    that stage and everything after it; only (a stage name or list) recomputes just those stages and
+    stops after the last of them.
+    """
+    if isinstance(only, str):
+        only = [only]
+    if incremental and (resume_from or only):
+        raise ValueError("resume_from/only cannot be combined with incremental runs")
+    force, wanted = resolve_stages(resume_from, only)
+    save_dir = save_dir or os.getcwd()
+    print(f"Working directory: {save_dir}")
+    report = RunReport(profile_stage=profile_stage or config.PROFILE_STAGE, hook=report_hook, profile_dir=save_dir)
+    report.meta.update(incremental=bool(incremental), model=config.MODEL_NAME)
+
+    # 1. Load
+    with report.stage("load") as st:
+        em, id_col, title_col, desc_col = load_emars(config.EMARS_XLSX)
+        tx, tax_path_col, tax_paths = load_taxonomy(config.TAXON_XLSX)
+        tree = PathTree(tax_paths)   # this run's parsed paths, passed to every stage
+        st.update(rows_out=len(em), taxonomy_paths=len(tax_paths))
+    print(f"Loaded emars: {len(em)} rows, taxonomy paths: {len(tax_paths)}")
+
+    if incremental:
+        # 2-5. Only new or changed incidents go through the per-incident stages
+        state_dir = state_dir or config.INCREMENTAL_STATE_DIR
+        fingerprint = run_fingerprint(config.TAXON_XLSX)
+        state = RunState.load(state_dir, fingerprint)
+        hashes = text_hashes(em, id_col)
+        added, changed, removed, unchanged = state.diff(hashes)
+        print(f"Incremental: {len(added)} added, {len(changed)} changed, {len(removed)} removed, {len(unchanged)} unchanged")
+        delta_ids = added | changed
+        em_delta = em[em[id_col].isin(delta_ids)]
+        report.meta.update(added=len(added), changed=len(changed), removed=len(removed), unchanged=len(unchanged))
+        stages = _Stages(report)
+        raw_delta, cons_delta = _assign_and_consolidate(em_delta, id_col, tax_paths, stages, tree) if len(em_delta) else (None, None)
+        ids = em[id_col].tolist()
+        assign_raw = _order_by_incident(state.merge("raw", raw_delta, unchanged), ids)
+        assign = _order_by_incident(state.merge("consolidated", cons_delta, unchanged), ids)
+
+        # unchanged incidents whose parent path entered or left the term cache are re-gated too
+        with report.stage("expected_terms", rows_in=len(assign)) as st:
+            path_term_cache = prepare_expected_terms_cache(assign, config.TAXON_XLSX, tree)
+            st["rows_out"] = len(path_term_cache)
+        recheck = state.parent_flipped_ids(assign, unchanged, tree)
+        gate_ids = delta_ids | recheck
+        with report.stage("evidence", rows_in=int(assign["Accident ID"].isin(gate_ids).sum())) as st:
+            ev_delta = apply_evidence_gate(assign[assign["Accident ID"].isin(gate_ids)], em[em[id_col].isin(gate_ids)], path_term_cache, tree=tree) if gate_ids else None
+            assign_supported = state.merge("evidence", ev_delta, unchanged - recheck)
+            assign_supported = assign_supported.sort_values(["Accident ID", "Cosine"], ascending=[True, False]).reset_index(drop=True)
+            st.set_output(assign_supported)
+        state.save(fingerprint, hashes, {"raw": assign_raw, "consolidated": assign, "evidence": assign_supported.copy()})
+    else:
+        store = None
+        if config.ENABLE_CHECKPOINTS or resume_from or only:
+            store = CheckpointStore(config.CHECKPOINT_DIR, stage_fingerprints(config.EMARS_XLSX, config.TAXON_XLSX))
+        stages = _Stages(report, store, force, wanted)
+        assign_raw, assign = _assign_and_consolidate(em, id_col, tax_paths, stages, tree, persist=config.PERSIST_EMBEDDINGS)
+        assign_supported = None
+        if stages.wants("evidence"):
+            def gate():
+                path_term_cache = prepare_expected_terms_cache(assign, config.TAXON_XLSX, tree)
+                return apply_evidence_gate(assign, em, path_term_cache, tree=tree)
+            assign_supported = stages.run("evidence", gate, rows_in=len(assign))
+
+    # 3-5. Per-incident outputs (serialized in the background while render runs)
+    writer = OutputWriter(save_dir)
+    for df, stage, label in ((assign_raw, "raw", "raw assignment"),
+                             (assign, "consolidated", "consolidated assignment"),
+                             (assign_supported, "evidence", "evidence-locked")):
+        if df is not None:
+            writer.submit(df, OUTPUT_NAMES[stage], label)
+
+    # 6. Collapse sparse children and render (global: recomputed from merged results)
+    assign_rendered, dot, pdf = None, None, None
+    if assign_supported is not None and stages.wants("rendered"):
+        assign_rendered = stages.run("rendered", lambda: depth_aware_render(collapse_sparse_children(assign_supported, tree=tree), tree=tree),
+                                     rows_in=len(assign_supported))
+        writer.submit(assign_rendered, OUTPUT_NAMES["rendered"], "rendered assignment")
+
+        # 7. Graph export (dot + optional pdf)
+        with report.stage("export_graph", rows_in=len(assign_rendered)):
+            dot, pdf = export_graph(assign_rendered)
+        print(f"Graph files: {dot}, {pdf}")
+
+    with report.stage("write_outputs") as st:
+        outputs = writer.close()
+        st["files"] = outputs
+
+    report_path = os.path.join(save_dir, config.RUN_REPORT_FILE)
+    run_report = report.write(report_path)
+    print(f"Saved run report: {report_path}")
 
     return {
         "raw": assign_raw,
@@ -62,8 +216,15 @@ def run_all(save_dir: str = None):
         "rendered": assign_rendered,
         "dot": dot,
         "pdf": pdf,
+        "report": run_report,
     }
 
 
 if __name__ == "__main__":
-    run_all()
+    import sys
+    args = sys.argv[1:]
+    def opt(flag):
+        return args[args.index(flag) + 1] if flag in args[:-1] else None
+    only = opt("--only")
+    run_all(incremental="--incremental" in args, profile_stage=opt("--profile"), resume_from=opt("--resume-from"),
+            only=only.split(",") if only else None)
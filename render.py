@@ -2,133 +2,195 @@
 Rendering helpers: collapse sparse children, depth-aware render, graph export.
 """
 import os
+import numpy as np
 import pandas as pd
-from utils import split_any, _fnum
+from tax_tree import PathTree
+from utils import split_any
 from config import MIN_CHILD_SUPPORT, MAX_CHILD_PER_PARENT, ENABLE_DEPTH_AWARE_RENDER, MAX_DEPTH_RENDER, DEPTH_CAP_LABEL, MIN_LEAF_SUPPORT_RENDER, LOW_SUPPORT_LABEL
 
 
-def collapse_sparse_children(assign_df: pd.DataFrame):
+def child_support_counts(assign_df: pd.DataFrame, tree: PathTree = None) -> pd.Series:
+    """Distinct incidents per (Parent, Leaf) of the non-UNCAT consolidated paths."""
+    tree = PathTree() if tree is None else tree
     tmp = assign_df[assign_df["Consolidated_Path"] != "UNCAT"].copy()
-    tmp["Parent"] = tmp["Consolidated_Path"].map(lambda p: split_any(p)[0] if len(split_any(p)) else "UNCAT")
-    tmp["Leaf"] = tmp["Consolidated_Path"].map(lambda p: split_any(p)[-1] if len(split_any(p)) else "UNCAT")
-    child_support = (tmp.groupby(["Parent", "Leaf"])["Accident ID"].nunique().rename("Support").reset_index())
+    nodes = tree.ids(tmp["Consolidated_Path"])
+    tmp["Parent"] = tree.root_labels(nodes, "UNCAT")
+    tmp["Leaf"] = tree.leaf_labels(nodes, "UNCAT")
+    return tmp.groupby(["Parent", "Leaf"])["Accident ID"].nunique().rename("Support")
+
+
+def collapse_sparse_children(assign_df: pd.DataFrame, support: pd.Series = None, tree: PathTree = None):
+    """Collapse sparse leaves to '<parent> > OTHER' (in place). `support` (see child_support_counts)
+    defaults to the counts of assign_df itself; streaming callers pass counts summed over all chunks."""
+    tree = PathTree() if tree is None else tree
+    if support is None:
+        support = child_support_counts(assign_df, tree)
+    child_support = support.rename("Support").rename_axis(["Parent", "Leaf"]).reset_index()
     child_support["RankInParent"] = child_support.groupby("Parent")["Support"].rank(method="first", ascending=False)
     keep_df = child_support[(child_support["Support"] >= MIN_CHILD_SUPPORT) & (child_support["RankInParent"] <= MAX_CHILD_PER_PARENT)].copy()
     keep_set = set(zip(keep_df["Parent"], keep_df["Leaf"]))
     def collapse_path(path: str):
         if path == "UNCAT": return path
-        parts = split_any(path)
-        if not parts: return "UNCAT"
-        if len(parts) == 1: return parts[0]
-        parent, leaf = parts[0], parts[-1]
+        node = tree.add(path)
+        if node < 0: return "UNCAT"
+        if tree.depth[node] == 1: return tree.leaf(node)
+        parent, leaf = tree.root_label(node), tree.leaf(node)
         if (parent, leaf) in keep_set:
             return path
         return f"{parent} > OTHER"
-    assign_df["Consolidated_Path"] = assign_df["Consolidated_Path"].map(collapse_path)
+    # once per distinct path
+    codes, uniques = pd.factorize(assign_df["Consolidated_Path"], use_na_sentinel=False)
+    collapsed = [collapse_path(p) for p in uniques]
+    assign_df["Consolidated_Path"] = np.asarray(collapsed, dtype=object)[codes]
     return assign_df
 
 
-def depth_aware_render(assign_df: pd.DataFrame):
-    assign = assign_df.copy()
+def _parse_unique_paths(uniques, tree):
+    """Per distinct path: part count, (parent, leaf) and the rendered string for every allowed depth."""
+    max_depth = int(MAX_DEPTH_RENDER)
+    n_parts = np.zeros(len(uniques), dtype=np.int64)
+    parent_leaf = []
+    # by_depth[u, d]: rendering at allowed depth d (capped below the full depth); low[u]: low-support variant
+    by_depth = np.empty((len(uniques), max_depth + 1), dtype=object)
+    low = np.empty(len(uniques), dtype=object)
+    for u, p in enumerate(uniques):
+        node = tree.add(p)
+        n = tree.depth[node] if node >= 0 else 0
+        n_parts[u] = n
+        parent_leaf.append((tree.root_label(node), tree.leaf(node)) if n else ("", ""))
+        full = tree.path(node)
+        for d in range(max_depth + 1):
+            by_depth[u, d] = (tree.path(tree.prefix(node, d)) + " > " + DEPTH_CAP_LABEL if d else DEPTH_CAP_LABEL) if d < n else full
+        if n >= 3 and str(tree.leaf(node)).strip().lower() != "other":
+            low[u] = tree.parent_path(node) + " > " + LOW_SUPPORT_LABEL
+    return n_parts, parent_leaf, by_depth, low
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors="coerce").astype(float).fillna(0.0).to_numpy()
+
+
+def _leaf_support_keys(assign_df, tree):
+    """Row codes into the distinct (parent, leaf) pairs of the Consolidated_Path values, plus the parse of each path."""
+    key = assign_df["Consolidated_Path"].astype(str)
+    codes, uniques = pd.factorize(key, use_na_sentinel=False)
+    parsed = _parse_unique_paths(uniques, tree)
+    pl_codes, pl_uniques = pd.factorize(pd.Series(parsed[1], dtype=object), use_na_sentinel=False)
+    return key, codes, parsed, pl_codes.astype(np.int64)[codes], list(pl_uniques)
+
+
+def leaf_support_counts(assign_df: pd.DataFrame, tree: PathTree = None) -> pd.Series:
+    """Distinct incidents per (parent, leaf) of the non-UNCAT (collapsed) consolidated paths."""
+    key, _, _, row_pl, pl_uniques = _leaf_support_keys(assign_df, PathTree() if tree is None else tree)
+    keep = (key != "UNCAT").to_numpy()
+    pairs = pd.DataFrame({"pl": row_pl[keep], "id": assign_df["Accident ID"].to_numpy()[keep]}).drop_duplicates()
+    counts = np.bincount(pairs["pl"].to_numpy(dtype=np.int64), minlength=len(pl_uniques))
+    index = pd.MultiIndex.from_tuples(pl_uniques, names=["Parent", "Leaf"]) if pl_uniques else pd.MultiIndex.from_arrays([[], []], names=["Parent", "Leaf"])
+    out = pd.Series(counts, index=index, name="LeafSupport")
+    return out[out > 0]
+
+
+def depth_aware_render(assign_df: pd.DataFrame, leaf_support: pd.Series = None, tree: PathTree = None):
+    """Depth-aware rendering; `leaf_support` (see leaf_support_counts) defaults to the counts of assign_df."""
+    assign = assign_df.reset_index(drop=True).copy()
     assign["Consolidated_Path_Full"] = assign["Consolidated_Path"]
-    tmp = assign[assign["Consolidated_Path_Full"].astype(str) != "UNCAT"].copy()
-    tmp["__parts"] = tmp["Consolidated_Path_Full"].map(lambda s: split_any(s))
-    tmp["__parent"] = tmp["__parts"].map(lambda z: z[0] if len(z) else "")
-    tmp["__leaf"] = tmp["__parts"].map(lambda z: z[-1] if len(z) else "")
-    leaf_support = (tmp.groupby(["__parent", "__leaf"])["Accident ID"].nunique().rename("LeafSupport").reset_index())
-    tmp = tmp.merge(leaf_support, on=["__parent", "__leaf"], how="left")
-    assign = assign.merge(tmp[["Accident ID", "Consolidated_Path_Full", "LeafSupport"]].drop_duplicates(), on=["Accident ID", "Consolidated_Path_Full"], how="left")
-
-    def _allowed_depth(row):
-        p = str(row.get("Consolidated_Path_Full", "UNCAT"))
-        if p == "UNCAT": return 0
-        cos = _fnum(row.get("Cosine", 0.0), 0.0)
-        cov = _fnum(row.get("Evidence_Coverage", 0.0), 0.0)
-        conf = 0.72 * cos + 0.28 * cov
-        d = 1
-        if conf >= 0.45 and cov >= 0.10: d = 2
-        if conf >= 0.54 and cov >= 0.22: d = 3
-        if conf >= 0.62 and cov >= 0.32: d = 4
-        max_depth = int(MAX_DEPTH_RENDER)
-        return int(min(max(d, 1), max_depth))
-
-    def _render_path(row):
-        p = str(row.get("Consolidated_Path_Full", "UNCAT"))
-        if p == "UNCAT": return "UNCAT"
-        parts = split_any(p)
-        if not parts: return "UNCAT"
-        d = int(max(1, min(len(parts), row.get("AllowedDepth", 1))))
-        out = parts[:d]
-        if d < len(parts):
-            return " > ".join(out + [DEPTH_CAP_LABEL])
-        ls = row.get("LeafSupport", None)
-        leaf = str(parts[-1]).strip().lower()
-        if len(parts) >= 3 and leaf != "other":
-            if (ls is not None) and int(ls) < int(MIN_LEAF_SUPPORT_RENDER):
-                return " > ".join(parts[:-1] + [LOW_SUPPORT_LABEL])
-        return " > ".join(parts)
+    key, codes, (n_parts, parent_leaf, by_depth, low), row_pl, pl_uniques = _leaf_support_keys(assign, PathTree() if tree is None else tree)
+    is_uncat = (key == "UNCAT").to_numpy()
+
+    # support of each (parent, leaf) = distinct incidents among non-UNCAT rows
+    if leaf_support is None:
+        pairs = pd.DataFrame({"pl": row_pl[~is_uncat], "id": assign["Accident ID"].to_numpy()[~is_uncat]}).drop_duplicates()
+        support = np.bincount(pairs["pl"].to_numpy(dtype=np.int64), minlength=len(pl_uniques))
+    else:
+        lookup = leaf_support.to_dict()
+        support = np.array([lookup.get(pl, 0) for pl in pl_uniques], dtype=np.int64)
+    leaf_support = np.where(is_uncat, np.nan, support[row_pl])
+    assign["LeafSupport"] = leaf_support if np.isnan(leaf_support).any() else leaf_support.astype(np.int64)
 
     if ENABLE_DEPTH_AWARE_RENDER:
-        assign["AllowedDepth"] = assign.apply(_allowed_depth, axis=1)
-        assign["Consolidated_Path_Render"] = assign.apply(_render_path, axis=1)
+        cos = _numeric(assign, "Cosine")
+        cov = _numeric(assign, "Evidence_Coverage")
+        conf = 0.72 * cos + 0.28 * cov
+        d = np.select([(conf >= 0.62) & (cov >= 0.32), (conf >= 0.54) & (cov >= 0.22), (conf >= 0.45) & (cov >= 0.10)], [4, 3, 2], 1)
+        d = np.minimum(np.maximum(d, 1), int(MAX_DEPTH_RENDER))
+        allowed = np.where(is_uncat, 0, d).astype(np.int64)
+
+        n_row = n_parts[codes]
+        d_row = np.maximum(1, np.minimum(n_row, allowed))
+        rendered = by_depth[codes, d_row]
+        low_row = low[codes]
+        use_low = (d_row >= n_row) & pd.notna(low_row) & (np.nan_to_num(leaf_support, nan=np.inf) < int(MIN_LEAF_SUPPORT_RENDER))
+        rendered = np.where(use_low, low_row, rendered)
+        rendered = np.where(is_uncat | (n_row == 0), "UNCAT", rendered)
+        assign["AllowedDepth"] = allowed
+        assign["Consolidated_Path_Render"] = pd.Series(rendered.tolist(), dtype=None)
     else:
         assign["AllowedDepth"] = None
         assign["Consolidated_Path_Render"] = assign["Consolidated_Path_Full"]
     return assign
 
 
-def export_graph(assign_df: pd.DataFrame, dot_filename="categorisation_tree_FINAL.dot", pdf_filename="categorisation_tree_FINAL.pdf"):
-    try:
-        import networkx as nx
-        import shutil
-        import subprocess
-    except Exception:
-        raise
-    viz_df = assign_df.copy()
-    def clean_path(row):
-        p_render = str(row.get("Consolidated_Path_Render", ""))
-        p_full = str(row.get("Consolidated_Path_Full", ""))
-        if "depth-capped" in p_render:
-            target = p_full
-        else:
-            target = p_render
-        if "UNCAT" in target:
-            return "Uncategorized"
-        return target
-    viz_df["Fixed_Path"] = viz_df.apply(clean_path, axis=1)
-    G = nx.DiGraph()
-    node_counts = {}
+def _fixed_paths(assign_df: pd.DataFrame) -> pd.Series:
+    """Path drawn per row: the full path when the render was depth-capped, 'Uncategorized' for UNCAT."""
+    n = len(assign_df)
+    p_render = assign_df["Consolidated_Path_Render"].map(str) if "Consolidated_Path_Render" in assign_df.columns else pd.Series([""] * n, index=assign_df.index)
+    p_full = assign_df["Consolidated_Path_Full"].map(str) if "Consolidated_Path_Full" in assign_df.columns else pd.Series([""] * n, index=assign_df.index)
+    target = p_full.where(p_render.str.contains("depth-capped", regex=False), p_render)
+    return target.where(~target.str.contains("UNCAT", regex=False), "Uncategorized")
+
+
+def build_prefix_tree(fixed_paths, root_label: str, root_count: int):
+    """Aggregate value counts of distinct paths into per-node tag counts, direct counts and edges.
+
+    Nodes are keyed by segment label (as in the drawn tree) and kept in first-seen order;
+    edges are {parent: {child: None}} in insertion order.
+    """
+    codes, uniques = pd.factorize(pd.Series(fixed_paths, dtype=object), use_na_sentinel=False)
+    counts = np.bincount(codes, minlength=len(uniques))
+    node_counts = {root_label: root_count}
     node_direct = {}
-    id_col = "Accident ID" if "Accident ID" in viz_df.columns else viz_df.columns[0]
-    unique_accidents = viz_df[id_col].nunique()
-    ROOT_LABEL = "eMARS Total"
-    node_counts[ROOT_LABEL] = unique_accidents
-    for _, row in viz_df.iterrows():
-        path_str = row["Fixed_Path"]
-        if ">" in path_str:
-            parts = [p.strip() for p in path_str.split(">")]
-        elif "/" in path_str:
-            parts = [p.strip() for p in path_str.split("/")]
-        else:
-            parts = [path_str.strip()]
-        parts = parts[:int(MAX_DEPTH_RENDER)]
-        current_node = ROOT_LABEL
+    children = {}
+    max_depth = int(MAX_DEPTH_RENDER)
+    for path_str, c in zip(uniques, counts.tolist()):
+        # rendered paths ('Uncategorized', '... > Other (low support)') are split here, not interned in a run's tree
+        parts = split_any(path_str)[:max_depth]
+        current_node = root_label
         for i, part in enumerate(parts):
             if not part: continue
-            child_node = part
-            if not G.has_edge(current_node, child_node):
-                G.add_edge(current_node, child_node)
-            node_counts[child_node] = node_counts.get(child_node, 0) + 1
+            children.setdefault(current_node, {})
+            children.setdefault(part, {})
+            children[current_node][part] = None
+            node_counts[part] = node_counts.get(part, 0) + c
             if i == len(parts) - 1:
-                node_direct[child_node] = node_direct.get(child_node, 0) + 1
-            current_node = child_node
+                node_direct[part] = node_direct.get(part, 0) + c
+            current_node = part
+    return node_counts, node_direct, children
+
+
+def to_networkx(children):
+    """Optional networkx.DiGraph view of a prefix tree (networkx is only needed for this)."""
+    import networkx as nx
+    G = nx.DiGraph()
+    G.add_edges_from((u, v) for u, vs in children.items() for v in vs)
+    return G
+
+
+def export_graph(assign_df: pd.DataFrame, dot_filename="categorisation_tree_FINAL.dot", pdf_filename="categorisation_tree_FINAL.pdf"):
+    import shutil
+    import subprocess
+    id_col = "Accident ID" if "Accident ID" in assign_df.columns else assign_df.columns[0]
+    ROOT_LABEL = "eMARS Total"
+    node_counts, node_direct, children = build_prefix_tree(_fixed_paths(assign_df), ROOT_LABEL, assign_df[id_col].nunique())
+    edges = [(u, v) for u, vs in children.items() for v in vs]
     def escape_label(s):
         return s.replace('"', '\\"').replace('\n', ' ')
     with open(dot_filename, "w", encoding="utf-8") as f:
         f.write("digraph Tree {\n")
         f.write('  rankdir=LR;\n')
         f.write('  node [shape=box, style="filled,rounded", fontname="Arial", fontsize=10, margin=0.2];\n')
-        for node in list(G.nodes()) + [ROOT_LABEL]:
+        for node in list(children) + [ROOT_LABEL]:
             if node not in node_counts: continue
             count = node_counts[node]
             direct = node_direct.get(node, 0)
@@ -142,7 +204,7 @@ def export_graph(assign_df: pd.DataFrame, dot_filename="categorisation_tree_FINA
                 if direct > 0 and direct != count:
                     label += f"\n(Direct: {direct})"
             f.write(f'  "{escape_label(node)}" [label="{escape_label(label)}", fillcolor="{fill}"];\n')
-        for u, v in G.edges():
+        for u, v in edges:
             f.write(f'  "{escape_label(u)}" -> "{escape_label(v)}";\n')
         f.write("}\n")
     dot_exe = shutil.which("dot")
@@ -0,0 +1,241 @@
+"""
+Warm classification service: the model, taxonomy embeddings and evidence terms are loaded once,
+then incidents are classified through assign -> consolidate -> evidence on request.
+
+Concurrent requests are gathered into micro-batches (SERVICE_MAX_BATCH incidents or
+SERVICE_BATCH_WAIT_MS) so each batch is a single encode call. Run with `python service.py`, then:
+
+    POST /classify  {"incidents": [{"id": 1, "title": "...", "description": "..."}]}
+                    (a single incident object, or {"text": "..."}, is accepted too)
+    GET  /health
+"""
+import os
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+import config
+from data import load_taxonomy
+from embeddings import load_model, encode_texts
+from embed_cache import EmbeddingCache
+from assign import parent_groups, score_parents_children, build_assignment_frame, _unit_rows
+from consolidate import consolidate_and_disambiguate
+from evidence import build_taxonomy_term_set, expected_terms_for, apply_evidence_gate, TermMatcher
+from writer import read_frame, OUTPUT_NAMES
+from utils import norm_text
+from tax_tree import PathTree
+
+# columns returned per assigned path
+RESULT_COLUMNS = ("Final_Category_Path", "Consolidated_Path", "Cosine", "Rank", "Parent", "Parent_Sim", "Parent_LowConf",
+                  "Evidence_Pass", "Evidence_Reason", "Evidence_Expected_Terms", "Evidence_Matched_Terms", "Evidence_Coverage")
+
+
+def incident_text(title="", description=""):
+    """The text load_emars builds for an incident (normalized title + description)."""
+    return (norm_text(title) + " " + norm_text(description)).strip()
+
+
+def _json_value(v):
+    if isinstance(v, (np.generic,)):
+        v = v.item()
+    if isinstance(v, float) and v != v:
+        return None
+    return v
+
+
+def _seed_paths(seed_dir):
+    """Distinct consolidated paths of the run_all output in seed_dir ('' = unseeded)."""
+    if not seed_dir:
+        return []
+    base = os.path.join(seed_dir, OUTPUT_NAMES["consolidated"])
+    try:
+        seed = read_frame(base, config.OUTPUT_FORMAT)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"no consolidated output {base}.* to seed the evidence term cache; run main.py first, "
+                                f"point SERVICE_SEED_DIR at its save_dir or set SERVICE_SEED_DIR='' to serve unseeded")
+    return seed["Consolidated_Path"].dropna().unique().tolist()
+
+
+class _UnionMatcher:
+    """Terms matched by any of several TermMatchers (each keeps the substring semantics of its own terms)."""
+
+    def __init__(self, *matchers):
+        self.matchers = matchers
+
+    def match(self, desc_norm: str) -> set:
+        out = set()
+        for m in self.matchers:
+            out |= m.match(desc_norm)
+        return out
+
+
+class Classifier:
+    """Resident model, taxonomy matrix and term cache; classify() handles one batch of incidents.
+
+    The evidence term cache and its matcher are built once at startup from the consolidated paths of
+    a full run's output (config.SERVICE_SEED_DIR, any OUTPUT_FORMAT), exactly as run_all builds them,
+    and never change, so a result does not depend on which requests came before. Paths a batch
+    produces outside that set get their terms in a per-batch copy. An incident of the seed export
+    therefore gets run_all's result; for others, parent backoff sees the seed paths plus the batch's.
+    Each batch parses its paths in its own PathTree, so nothing resident grows.
+    """
+
+    def __init__(self, model=None, taxon_xlsx=None, seed_dir=None):
+        taxon_xlsx = taxon_xlsx or config.TAXON_XLSX
+        self.model = model if model is not None else load_model(config.MODEL_NAME)
+        _, _, self.tax_paths = load_taxonomy(taxon_xlsx)
+        cache = None
+        if config.ENABLE_EMBED_CACHE:
+            cache = EmbeddingCache(config.EMBED_CACHE_DIR, config.MODEL_NAME, normalize=True, max_bytes=config.EMBED_CACHE_MAX_BYTES)
+        tax_emb = encode_texts(self.model, self.tax_paths, show_progress_bar=False, cache=cache)
+        self.tax_u_t = np.ascontiguousarray(_unit_rows(tax_emb).T)
+        tree = PathTree(self.tax_paths)
+        self.parent_names, self.codes = parent_groups(self.tax_paths, tree)
+        self.taxonomy_terms = build_taxonomy_term_set(taxon_xlsx)
+        paths = _seed_paths(config.SERVICE_SEED_DIR if seed_dir is None else seed_dir)
+        self.path_term_cache = expected_terms_for(paths, self.taxonomy_terms, tree)
+        self._terms = frozenset(t for terms in self.path_term_cache.values() for t in terms)
+        self.matcher = TermMatcher(self._terms)
+
+    def _batch_terms(self, paths, tree):
+        """(term cache, matcher) for one batch: the startup ones, or copies extended with the batch's unseen paths."""
+        new = [p for p in paths if p not in self.path_term_cache]
+        if not new:
+            return self.path_term_cache, self.matcher
+        added = expected_terms_for(new, self.taxonomy_terms, tree)
+        extra = {t for ts in added.values() for t in ts} - self._terms
+        matcher = _UnionMatcher(self.matcher, TermMatcher(extra)) if extra else self.matcher
+        return {**self.path_term_cache, **added}, matcher
+
+    def classify(self, texts):
+        """Evidence-locked rows for each text: a list (per input) of lists of result dicts."""
+        texts = [str(t) for t in texts]
+        if not texts:
+            return []
+        ids = list(range(len(texts)))
+        em = pd.DataFrame({"Accident ID": ids, "_emars_text_": texts})
+        emb = encode_texts(self.model, texts, show_progress_bar=False)
+        S = _unit_rows(emb) @ self.tax_u_t
+        stats = score_parents_children(S, self.codes, len(self.parent_names), config.TOPK_CHILD)
+        raw = build_assignment_frame(ids, stats, self.parent_names, self.tax_paths)
+        tree = PathTree()
+        cons = consolidate_and_disambiguate(raw, em, "Accident ID", tree=tree)
+        cache, matcher = self._batch_terms(cons["Consolidated_Path"].dropna().unique(), tree)
+        ev = apply_evidence_gate(cons, em, cache, matcher, tree=tree)
+        cols = [c for c in RESULT_COLUMNS if c in ev.columns]
+        out = [[] for _ in texts]
+        for i, rec in zip(ev["Accident ID"].tolist(), ev[cols].to_dict("records")):
+            out[i].append({k: _json_value(v) for k, v in rec.items()})
+        return out
+
+
+class MicroBatcher:
+    """Gathers concurrent submit() calls into one Classifier.classify call per batch."""
+
+    def __init__(self, classifier, max_batch=None, wait_ms=None):
+        self.classifier = classifier
+        self.max_batch = int(max_batch or config.SERVICE_MAX_BATCH)
+        self.wait_s = (config.SERVICE_BATCH_WAIT_MS if wait_ms is None else wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="classify-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts) -> Future:
+        fut = Future()
+        self._queue.put((list(texts), fut))
+        return fut
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            n = len(batch[0][0])
+            try:
+                while n < self.max_batch:
+                    item = self._queue.get(timeout=self.wait_s)
+                    batch.append(item)
+                    n += len(item[0])
+            except queue.Empty:
+                pass
+            texts = [t for item, _ in batch for t in item]
+            try:
+                results = self.classifier.classify(texts)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            pos = 0
+            for item, fut in batch:
+                fut.set_result(results[pos:pos + len(item)])
+                pos += len(item)
+
+
+def _parse_incidents(payload):
+    items = payload.get("incidents", [payload]) if isinstance(payload, dict) else payload
+    ids, texts = [], []
+    for i, inc in enumerate(items):
+        ids.append(inc.get("id", i))
+        texts.append(inc["text"] if "text" in inc else incident_text(inc.get("title", ""), inc.get("description", "")))
+    return ids, texts
+
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "taxonomy_paths": len(batcher.classifier.tax_paths)})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/classify":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                ids, texts = _parse_incidents(payload)
+            except Exception as e:
+                self._send(400, {"error": f"bad request: {e}"})
+                return
+            try:
+                results = batcher.submit(texts).result()
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {"results": [{"id": i, "assignments": r} for i, r in zip(ids, results)]})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def serve(host=None, port=None, classifier=None):
+    classifier = classifier or Classifier()
+    batcher = MicroBatcher(classifier)
+    port = config.SERVICE_PORT if port is None else port
+    server = ThreadingHTTPServer((host or config.SERVICE_HOST, int(port)), make_handler(batcher))
+    print(f"Classification service on http://{server.server_address[0]}:{server.server_address[1]} "
+          f"({len(classifier.tax_paths)} taxonomy paths)")
+    return server
+
+
+if __name__ == "__main__":
+    srv = serve()
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
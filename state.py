@@ -0,0 +1,133 @@
+"""
+Incremental-run state store: per-incident text hashes plus the per-incident stage outputs
+(raw assignment, consolidated, evidence-locked) of the previous run.
+"""
+import os
+import json
+import uuid
+import hashlib
+import pandas as pd
+import config
+from tax_tree import PathTree
+
+STAGES = ("raw", "consolidated", "evidence")
+
+def file_signature(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run_fingerprint(taxon_xlsx: str) -> str:
+    """Hash of the taxonomy and the config of every stage up to evidence; a change forces a full rerun."""
+    from checkpoint import STAGE_CONFIG, STAGE_ORDER   # checkpoint imports this module
+    keys = [k for stage in STAGE_ORDER[:STAGE_ORDER.index(STAGES[-1]) + 1] for k in STAGE_CONFIG[stage]]
+    payload = {k: getattr(config, k, None) for k in keys}
+    payload["TAXON_XLSX"] = file_signature(taxon_xlsx) if os.path.exists(taxon_xlsx) else taxon_xlsx
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def text_hashes(em: pd.DataFrame, id_col: str) -> dict:
+    return {k: hashlib.sha1(str(t).encode("utf-8")).hexdigest()
+            for k, t in zip(em[id_col].tolist(), em["_emars_text_"].tolist())}
+
+
+class RunState:
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.fingerprint = None
+        self.hashes = {}
+        self.frames = {}
+
+    @classmethod
+    def load(cls, state_dir: str, fingerprint: str):
+        """Load the previous run; an empty state is returned if it is missing or was made with other inputs."""
+        st = cls(state_dir)
+        meta_path = os.path.join(state_dir, "state.json")
+        if not os.path.exists(meta_path):
+            return st
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != fingerprint:
+                return st
+            files = meta.get("files") or {s: f"{s}.pkl" for s in STAGES}
+            frames = {s: pd.read_pickle(os.path.join(state_dir, files[s])) for s in STAGES}
+        except Exception:
+            return st
+        st.fingerprint = fingerprint
+        st.hashes = {_restore_id(k, meta.get("id_types", {}).get(k)): v for k, v in meta.get("hashes", {}).items()}
+        st.frames = frames
+        return st
+
+    def diff(self, hashes: dict):
+        """Split current incident ids into (added, changed, removed, unchanged) sets."""
+        cur, old = set(hashes), set(self.hashes)
+        added = cur - old
+        removed = old - cur
+        changed = {k for k in cur & old if hashes[k] != self.hashes[k]}
+        unchanged = (cur & old) - changed
+        return added, changed, removed, unchanged
+
+    def merge(self, stage: str, delta_df: pd.DataFrame, keep_ids) -> pd.DataFrame:
+        """Previous rows of the unchanged incidents plus the freshly computed delta rows."""
+        prev = self.frames.get(stage)
+        if prev is None or prev.empty or not keep_ids:
+            if delta_df is None:
+                return pd.DataFrame(columns=prev.columns if prev is not None else ["Accident ID"])
+            return delta_df.reset_index(drop=True)
+        kept = prev[prev["Accident ID"].isin(keep_ids)]
+        if delta_df is None or delta_df.empty:
+            return kept.reset_index(drop=True)
+        return pd.concat([kept, delta_df], ignore_index=True)
+
+    def parent_flipped_ids(self, assign: pd.DataFrame, unchanged, tree: PathTree = None) -> set:
+        """Unchanged incidents whose consolidated parent path entered or left the set of consolidated paths.
+
+        The evidence term cache is built from every consolidated path and parent backoff looks the parent
+        path up in it, so these incidents must be re-gated even though their own rows did not change.
+        """
+        prev = self.frames.get("consolidated")
+        prev_paths = set(prev["Consolidated_Path"].dropna()) if prev is not None else set()
+        flipped = prev_paths ^ set(assign["Consolidated_Path"].dropna())
+        tree = PathTree() if tree is None else tree
+        parent_of = pd.Series(tree.parent_paths(tree.ids(assign["Consolidated_Path"])), index=assign.index).where(assign["Consolidated_Path"] != "UNCAT")
+        return set(assign.loc[parent_of.isin(flipped), "Accident ID"]) & set(unchanged)
+
+    def save(self, fingerprint: str, hashes: dict, frames: dict):
+        """Write the frames under names new to this save, then state.json naming them (os.replace).
+
+        state.json is the commit point: a crash before it is replaced leaves the previous state intact,
+        and the previous run's frames are removed only afterwards.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        files = {s: f"{s}_{generation}.pkl" for s in STAGES}
+        for s in STAGES:
+            tmp = os.path.join(self.state_dir, files[s] + ".tmp")
+            frames[s].to_pickle(tmp)
+            os.replace(tmp, os.path.join(self.state_dir, files[s]))
+        meta = {
+            "fingerprint": fingerprint,
+            "files": files,
+            "hashes": {str(k): v for k, v in hashes.items()},
+            "id_types": {str(k): type(k).__name__ for k in hashes},
+        }
+        tmp = os.path.join(self.state_dir, "state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.state_dir, "state.json"))
+        for name in os.listdir(self.state_dir):
+            if name.startswith(STAGES) and name.endswith((".pkl", ".pkl.tmp")) and name not in files.values():
+                os.remove(os.path.join(self.state_dir, name))
+        self.fingerprint, self.hashes, self.frames = fingerprint, dict(hashes), dict(frames)
+
+
+def _restore_id(k: str, type_name):
+    if type_name == "int":
+        return int(k)
+    if type_name == "float":
+        return float(k)
+    return k
@@ -0,0 +1,205 @@
+"""
+Streaming classifier for exports too large to hold in memory: incidents are read from a CSV/JSONL
+file (or stdin) in chunks and every output is appended chunk by chunk.
+
+    python stream.py incidents.jsonl --out results/
+    cat incidents.csv | python stream.py - --input-format csv
+
+Per chunk, encode -> assign_hierarchical -> consolidate_and_disambiguate runs as a generator pipeline
+and the consolidated chunk is spilled to a temporary directory. The evidence term cache and the
+collapse/render supports are global in run_all (parent backoff looks up every assigned path; leaf
+support counts incidents over the whole export), so they are rebuilt from lightweight passes over the
+spilled chunks: the distinct consolidated paths, then the (parent, leaf) support counts. The outputs
+therefore match run_all row for row, with rows ordered by input chunk.
+"""
+import os
+import sys
+import gzip
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+import config
+from data import load_taxonomy, prepare_emars_frame
+from embeddings import load_model, encode_texts
+from embed_cache import EmbeddingCache
+from assign import assign_hierarchical
+from consolidate import consolidate_and_disambiguate
+from evidence import build_taxonomy_term_set, expected_terms_for, apply_evidence_gate, TermMatcher
+from render import child_support_counts, collapse_sparse_children, leaf_support_counts, depth_aware_render
+from writer import OUTPUT_FORMATS, OUTPUT_NAMES
+from utils import unique_texts
+from tax_tree import PathTree
+
+STREAM_FORMATS = ("csv", "csv.gz")
+
+
+def _input_format(source, input_format=None):
+    if input_format:
+        return input_format
+    name = str(source).lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "jsonl" if source == "-" or name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def iter_incident_chunks(source, chunk_rows=None, input_format=None):
+    """Yield (em, id_col) per chunk of `chunk_rows` incidents; source is a CSV/JSONL path or '-' for stdin."""
+    chunk_rows = int(chunk_rows or config.STREAM_CHUNK_ROWS)
+    fmt = _input_format(source, input_format)
+    src = sys.stdin if source == "-" else source
+    if fmt == "jsonl":
+        reader = pd.read_json(src, lines=True, chunksize=chunk_rows, convert_dates=False)
+    elif fmt == "csv":
+        reader = pd.read_csv(src, chunksize=chunk_rows)
+    else:
+        raise ValueError(f"input format must be 'csv' or 'jsonl', got {fmt!r}")
+    with reader:
+        for chunk in reader:
+            em, id_col, _, _ = prepare_emars_frame(chunk.reset_index(drop=True))
+            yield em, id_col
+
+
+def classify_chunks(chunks, model, tax_paths, tax_emb, cache=None, index=None, tree=None):
+    """Generator: (em, raw, consolidated) for each (em, id_col) chunk, with the model and taxonomy resident."""
+    tree = PathTree(tax_paths) if tree is None else tree
+    for em, id_col in chunks:
+        texts, text_index = em["_emars_text_"].tolist(), None
+        if config.DEDUP_TEXTS:
+            texts, text_index = unique_texts(texts)
+        em_emb = encode_texts(model, texts, show_progress_bar=False, cache=cache)
+        raw = assign_hierarchical(em, id_col, tax_paths, em_emb, tax_emb, index=index, text_index=text_index, tree=tree)
+        yield em, raw, consolidate_and_disambiguate(raw, em, id_col, tree=tree)
+
+
+class _ChunkSink:
+    """Appends frames to one CSV (or gzip CSV) file; the header is `columns` or the first frame's columns."""
+
+    def __init__(self, base_path, fmt, columns=None):
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"streaming output format must be one of {STREAM_FORMATS}, got {fmt!r}")
+        self.path = base_path + OUTPUT_FORMATS[fmt]
+        self.fmt = fmt
+        self.columns = columns
+        self._f = None
+
+    def write(self, df):
+        if self._f is None:
+            if self.fmt == "csv.gz":
+                level = config.OUTPUT_COMPRESSION_LEVEL
+                self._f = gzip.open(self.path + ".tmp", "wt", encoding="utf-8", newline="", compresslevel=level if level is not None else 6)
+            else:
+                self._f = open(self.path + ".tmp", "w", encoding="utf-8", newline="")
+            self.columns = list(self.columns or df.columns)
+            df.reindex(columns=self.columns).to_csv(self._f, index=False)
+        else:
+            df.reindex(columns=self.columns).to_csv(self._f, index=False, header=False)
+
+    def close(self):
+        if self._f is None:
+            return None
+        self._f.close()
+        self._f = None
+        os.replace(self.path + ".tmp", self.path)
+        return self.path
+
+
+def _ordered_union(columns, extra):
+    return columns + [c for c in extra if c not in columns]
+
+
+def stream_classify(source, save_dir=None, chunk_rows=None, input_format=None, output_format=None, model=None, taxon_xlsx=None):
+    """Classify incidents from `source` chunk by chunk and write run_all's four CSV outputs to save_dir.
+
+    Memory is bounded by the chunk size plus the taxonomy; returns a summary dict with the output paths.
+    """
+    save_dir = save_dir or os.getcwd()
+    os.makedirs(save_dir, exist_ok=True)
+    taxon_xlsx = taxon_xlsx or config.TAXON_XLSX
+    fmt = output_format or (config.OUTPUT_FORMAT if config.OUTPUT_FORMAT in STREAM_FORMATS else "csv.gz")
+    out = lambda name: os.path.join(save_dir, name)
+
+    model = model if model is not None else load_model(config.MODEL_NAME)
+    _, _, tax_paths = load_taxonomy(taxon_xlsx)
+    tree = PathTree(tax_paths)
+    cache = None
+    if config.ENABLE_EMBED_CACHE:
+        cache = EmbeddingCache(config.EMBED_CACHE_DIR, config.MODEL_NAME, normalize=True, max_bytes=config.EMBED_CACHE_MAX_BYTES)
+    tax_emb = encode_texts(model, tax_paths, show_progress_bar=False, cache=cache)
+    index = None
+    if config.ASSIGN_USE_INDEX:
+        from tax_index import HierarchicalIndex
+        index = HierarchicalIndex(tax_paths, tax_emb, tree=tree)
+
+    with tempfile.TemporaryDirectory(prefix="emars_stream_", dir=config.STREAM_SPILL_DIR) as spill:
+        spilled = lambda stage, i: os.path.join(spill, f"{stage}_{i:06d}.pkl")
+
+        # pass 1: encode -> assign -> consolidate per chunk; raw and consolidated outputs are appended as they come
+        raw_sink = _ChunkSink(out(OUTPUT_NAMES["raw"]), fmt)
+        cons_sink = _ChunkSink(out(OUTPUT_NAMES["consolidated"]), fmt)
+        paths, n_chunks, n_incidents, n_rows = set(), 0, 0, 0
+        for i, (em, raw, cons) in enumerate(classify_chunks(iter_incident_chunks(source, chunk_rows, input_format),
+                                                             model, tax_paths, tax_emb, cache, index, tree)):
+            raw_sink.write(raw)
+            cons_sink.write(cons)
+            paths.update(cons["Consolidated_Path"].dropna().unique().tolist())
+            em[[em.columns[0], "_emars_text_"]].to_pickle(spilled("em", i))
+            cons.to_pickle(spilled("cons", i))
+            n_chunks, n_incidents, n_rows = n_chunks + 1, n_incidents + len(em), n_rows + len(raw)
+            print(f"Chunk {i + 1}: {len(em)} incidents, {len(raw)} rows")
+        files = [raw_sink.close(), cons_sink.close()]
+
+        # pass 2: evidence gate against the term cache of every consolidated path
+        path_term_cache = expected_terms_for(sorted(paths), build_taxonomy_term_set(taxon_xlsx), tree)
+        matcher = TermMatcher.from_cache(path_term_cache)
+        child_support, ev_columns = None, []
+        for i in range(n_chunks):
+            ev = apply_evidence_gate(pd.read_pickle(spilled("cons", i)), pd.read_pickle(spilled("em", i)), path_term_cache, matcher, tree=tree)
+            ev = ev.sort_values(["Accident ID", "Cosine"], ascending=[True, False]).reset_index(drop=True)
+            ev.to_pickle(spilled("ev", i))
+            ev_columns = _ordered_union(ev_columns, ev.columns)
+            counts = child_support_counts(ev, tree)
+            child_support = counts if child_support is None else child_support.add(counts, fill_value=0)
+
+        # pass 3: evidence output, and the leaf supports of the collapsed paths
+        ev_sink = _ChunkSink(out(OUTPUT_NAMES["evidence"]), fmt, ev_columns)
+        leaf_support = None
+        for i in range(n_chunks):
+            ev = pd.read_pickle(spilled("ev", i))
+            ev_sink.write(ev)
+            counts = leaf_support_counts(collapse_sparse_children(ev, child_support.astype(np.int64), tree), tree)
+            leaf_support = counts if leaf_support is None else leaf_support.add(counts, fill_value=0)
+        files.append(ev_sink.close())
+
+        # pass 4: collapse and render with the global supports
+        rend_sink = _ChunkSink(out(OUTPUT_NAMES["rendered"]), fmt)
+        for i in range(n_chunks):
+            ev = collapse_sparse_children(pd.read_pickle(spilled("ev", i)), child_support.astype(np.int64), tree)
+            rend = depth_aware_render(ev, leaf_support.astype(np.int64), tree)
+            if rend_sink.columns is None:
+                rend_sink.columns = _ordered_union(ev_columns, rend.columns)
+            rend_sink.write(rend)
+        files.append(rend_sink.close())
+
+    files = [f for f in files if f]
+    for f in files:
+        print(f"Saved: {f}")
+    return {"chunks": n_chunks, "incidents": n_incidents, "rows": n_rows, "files": files}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("source", help="CSV or JSONL file, or '-' for stdin")
+    ap.add_argument("--out", help="output directory (default: current directory)")
+    ap.add_argument("--chunk-rows", type=int, default=None, help=f"incidents per chunk (default {config.STREAM_CHUNK_ROWS})")
+    ap.add_argument("--input-format", choices=["csv", "jsonl"], help="default: from the file extension (stdin: jsonl)")
+    ap.add_argument("--output-format", choices=list(STREAM_FORMATS))
+    args = ap.parse_args(argv)
+    res = stream_classify(args.source, args.out, args.chunk_rows, args.input_format, args.output_format)
+    print(f"Streamed {res['incidents']} incidents in {res['chunks']} chunks ({res['rows']} assignment rows)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Threshold sweeps for the hierarchical assignment: the similarity statistics are computed once
+and every combination of PARENT_MIN_SIM / PARENT_MARGIN / CHILD_MIN_SIM / CHILD_MARGIN / TOPK_CHILD
+is evaluated on them with array operations, using the same selection rules as build_assignment_frame.
+"""
+import itertools
+import numpy as np
+import pandas as pd
+import config
+from assign import parent_groups, score_blocked, build_assignment_frame
+
+SWEEP_PARAMS = ("parent_min_sim", "parent_margin", "child_min_sim", "child_margin", "topk_child")
+
+
+def sweep_stats(em_emb, tax_emb, tax_paths, max_topk, text_index=None, block_rows=None):
+    """(stats, parent_names) with `max_topk` ranked children per incident, fanned out per incident by text_index."""
+    parent_names, codes = parent_groups(tax_paths)
+    stats = score_blocked(em_emb, tax_emb, codes, len(parent_names), max_topk, block_rows=block_rows)
+    if text_index is not None:
+        stats = {key: v[text_index] for key, v in stats.items()}
+    return stats, parent_names
+
+
+def threshold_grid(**values):
+    """Cartesian grid as a DataFrame, one column per SWEEP_PARAMS entry; omitted parameters keep their config value."""
+    axes = [list(np.atleast_1d(values.get(p, getattr(config, p.upper())))) for p in SWEEP_PARAMS]
+    unknown = set(values) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"unknown sweep parameters: {sorted(unknown)}")
+    grid = pd.DataFrame(list(itertools.product(*axes)), columns=list(SWEEP_PARAMS))
+    grid["topk_child"] = grid["topk_child"].astype(np.int64)
+    return grid
+
+
+def _evaluate(stats, grid, n_cats):
+    """Vectorized over (combination, incident, rank) for one chunk of the grid."""
+    g = len(grid)
+    pmin = grid["parent_min_sim"].to_numpy(np.float64)[:, None]
+    pmar = grid["parent_margin"].to_numpy(np.float64)[:, None]
+    cmin = grid["child_min_sim"].to_numpy(np.float64)[:, None, None]
+    cmar = grid["child_margin"].to_numpy(np.float64)[:, None, None]
+    topk = grid["topk_child"].to_numpy(np.int64)
+
+    best_parent = stats["best_parent"]
+    best_sim = stats["best_sim"][None, :]
+    n = best_sim.shape[1]
+    uncat = best_sim < pmin                                            # (g, n)
+    low_conf = (best_sim - stats["second_sim"][None, :]) < pmar
+    child_idx, child_sim = stats["child_idx"], stats["child_sim"]
+    k = child_idx.shape[1]
+    child_best = child_sim[:, :1] if k else np.full((n, 1), -np.inf)
+    sel = (child_idx >= 0)[None] & ((child_sim[None] >= cmin) | ((child_best - child_sim)[None] <= cmar))
+    sel &= np.arange(k)[None, None, :] < topk[:, None, None]
+    sel = np.cumprod(sel, axis=2).astype(bool)                         # (g, n, k): ranked prefix
+    sel &= ~uncat[:, :, None]
+    n_sel = sel.sum(axis=2)
+    n_out = np.where(n_sel > 0, n_sel, 1)
+    other = ~uncat & (n_sel == 0)
+
+    # children are ranked within the best parent, so every non-UNCAT row falls in that top-level category
+    key = (np.arange(g)[:, None] * (n_cats + 1) + best_parent[None, :]).ravel()
+    counts = np.bincount(key, weights=(n_out * ~uncat).ravel(), minlength=g * (n_cats + 1)).reshape(g, n_cats + 1)
+    counts[:, n_cats] = uncat.sum(axis=1)
+
+    distinct = [len(np.unique(np.broadcast_to(child_idx, sel.shape[1:])[sel[i]])) + len(np.unique(best_parent[other[i]]))
+                for i in range(g)]
+    summary = pd.DataFrame({
+        "uncat_rate": uncat.mean(axis=1) if n else np.zeros(g),
+        "lowconf_rate": (low_conf | uncat).mean(axis=1) if n else np.zeros(g),
+        "other_rate": other.mean(axis=1) if n else np.zeros(g),
+        "paths_per_incident": n_out.mean(axis=1) if n else np.zeros(g),
+        "rows": n_out.sum(axis=1),
+        "distinct_paths": distinct,
+    })
+    return summary, counts.astype(np.int64)
+
+
+def sweep_thresholds(stats, parent_names, grid=None, chunk=None, **values):
+    """Evaluate a threshold grid on precomputed statistics.
+
+    `grid` is a DataFrame with SWEEP_PARAMS columns (see threshold_grid); alternatively pass the value
+    lists as keyword arguments. Returns (summary, distribution): one summary row per combination with
+    UNCAT / low-confidence / OTHER rates, paths per incident and distinct paths, and a long frame of
+    (combo, category, rows) with the non-zero assignment row counts per top-level category (or UNCAT),
+    where combo is the summary row.
+    """
+    grid = threshold_grid(**values) if grid is None else grid.reset_index(drop=True)
+    k_max = stats["child_idx"].shape[1]
+    if len(grid) and grid["topk_child"].max() > k_max:
+        raise ValueError(f"stats hold {k_max} ranked children; recompute them with max_topk >= {grid['topk_child'].max()}")
+    n_cats = len(parent_names)
+    # keep the (combination, incident, rank) temporaries around 64 MB per chunk
+    n, k = stats["child_idx"].shape
+    chunk = chunk or max(1, int(64 * 1024 * 1024 // max(1, n * max(k, 1) * 24)))
+    categories = np.asarray(list(parent_names) + ["UNCAT"], dtype=object)
+    parts, dists = [], []
+    for start in range(0, len(grid), chunk):
+        s, c = _evaluate(stats, grid.iloc[start:start + chunk], n_cats)
+        combo, cat = np.nonzero(c)
+        parts.append(s)
+        dists.append(pd.DataFrame({"combo": combo + start, "category": categories[cat], "rows": c[combo, cat]}))
+    summary = pd.concat([grid, pd.concat(parts, ignore_index=True)], axis=1) if parts else grid.assign()
+    distribution = pd.concat(dists, ignore_index=True) if dists else pd.DataFrame(columns=["combo", "category", "rows"])
+    return summary, distribution
+
+
+def assignment_for(stats, parent_names, tax_paths, ids, **thresholds):
+    """The raw assignment frame for one chosen combination (e.g. a row of the sweep summary)."""
+    return build_assignment_frame(ids, stats, parent_names, tax_paths, **{k: thresholds[k] for k in SWEEP_PARAMS if k in thresholds})
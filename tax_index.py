@@ -0,0 +1,163 @@
+"""
+Two-stage hierarchical taxonomy index: incidents are scored against parent centroids first and
+only the children of the shortlisted parents are searched exactly.
+"""
+import numpy as np
+import config
+from tax_tree import PathTree
+from assign import parent_groups, topk_columns, _unit_rows, block_rows_for, score_blocked
+
+
+def _merge_topk(cur_idx, cur_sim, new_idx, new_sim, k):
+    idx = np.concatenate([cur_idx, new_idx], axis=1)
+    sim = np.concatenate([cur_sim, new_sim], axis=1)
+    # empty slots carry -inf / -1 and sort last; ties keep the lower taxonomy index first
+    o = np.lexsort((np.where(idx < 0, np.iinfo(np.int64).max, idx), -sim), axis=-1)[:, :k]
+    return np.take_along_axis(idx, o, axis=1), np.take_along_axis(sim, o, axis=1)
+
+
+class HierarchicalIndex:
+    """Parent centroids plus per-parent child matrices built once from the taxonomy.
+
+    With deep=True each parent is further split into groups sharing the first two path
+    segments, and only the best `group_shortlist` groups of a shortlisted parent are searched.
+    """
+
+    def __init__(self, tax_paths, tax_emb, deep=None, tree=None):
+        self.tax_paths = list(tax_paths)
+        self.deep = config.ASSIGN_INDEX_DEEP if deep is None else bool(deep)
+        tree = PathTree() if tree is None else tree
+        self.parent_names, codes = parent_groups(self.tax_paths, tree)
+        self.n_parents = len(self.parent_names)
+
+        group_keys = {}
+        group_codes = np.empty(len(self.tax_paths), dtype=np.int64)
+        nodes = tree.ids(self.tax_paths).tolist()
+        for j, node in enumerate(nodes):
+            second = tree.leaf(tree.prefix(node, 2)) if self.deep and node >= 0 and tree.depth[node] > 1 else None
+            group_codes[j] = group_keys.setdefault((codes[j], second), len(group_keys))
+
+        # columns laid out contiguously by parent, then group; original order kept inside a group
+        self.col_order = np.lexsort((np.arange(len(codes)), group_codes, codes))
+        g_sorted = group_codes[self.col_order]
+        # renumber groups 0..G-1 in layout order
+        g_sorted = np.cumsum(np.r_[True, g_sorted[1:] != g_sorted[:-1]]) - 1 if len(g_sorted) else g_sorted
+        n_groups = int(g_sorted[-1]) + 1 if len(g_sorted) else 0
+
+        tax_u = _unit_rows(tax_emb)
+        self.child_mat = np.ascontiguousarray(tax_u[self.col_order])
+        self.group_start = np.searchsorted(g_sorted, np.arange(n_groups))
+        self.group_end = np.searchsorted(g_sorted, np.arange(n_groups), side="right")
+        self.group_parent = codes[self.col_order][self.group_start] if n_groups else np.zeros(0, np.int64)
+        self.parent_group_start = np.searchsorted(self.group_parent, np.arange(self.n_parents))
+        self.parent_group_end = np.searchsorted(self.group_parent, np.arange(self.n_parents), side="right")
+
+        self.group_centroids = _unit_rows(np.add.reduceat(self.child_mat, self.group_start, axis=0)) if n_groups else np.zeros((0, tax_u.shape[1]), np.float32)
+        parent_start = self.group_start[self.parent_group_start] if self.n_parents else np.zeros(0, np.int64)
+        self.parent_centroids = _unit_rows(np.add.reduceat(self.child_mat, parent_start, axis=0)) if self.n_parents else np.zeros((0, tax_u.shape[1]), np.float32)
+
+    def __len__(self):
+        return len(self.tax_paths)
+
+    def _score_block(self, E, shortlist, group_shortlist, k):
+        b = len(E)
+        P = self.n_parents
+        s = P if P <= 2 else int(min(max(shortlist, 2), P))
+        C = E @ self.parent_centroids.T
+        sl = np.argpartition(-C, s - 1, axis=1)[:, :s] if s < P else np.tile(np.arange(P), (b, 1))
+        # ordering slots by parent code makes argmax ties resolve like the exact engine
+        sl = np.sort(sl, axis=1)
+
+        slot_max = np.full((b, s), -np.inf, dtype=np.float32)
+        slot_idx = np.full((b, s, k), -1, dtype=np.int64)
+        slot_sim = np.full((b, s, k), -np.inf, dtype=np.float32)
+        # (row, slot) pairs grouped by parent in one stable sort, each group in row-major order
+        flat = sl.ravel()
+        order = np.argsort(flat, kind="stable")
+        cuts = np.flatnonzero(np.diff(flat[order])) + 1
+        for p, pairs in zip(flat[order[np.r_[0, cuts]]].tolist(), np.split(order, cuts)):
+            rows, slots = pairs // s, pairs % s
+            g0, g1 = self.parent_group_start[p], self.parent_group_end[p]
+            n_groups = g1 - g0
+            if group_shortlist and n_groups > group_shortlist:
+                G = E[rows] @ self.group_centroids[g0:g1].T
+                chosen = np.zeros((len(rows), n_groups), dtype=bool)
+                np.put_along_axis(chosen, np.argpartition(-G, group_shortlist - 1, axis=1)[:, :group_shortlist], True, axis=1)
+            else:
+                chosen = np.ones((len(rows), n_groups), dtype=bool)
+            best = np.full(len(rows), -np.inf, dtype=np.float32)
+            cur_idx = np.full((len(rows), k), -1, dtype=np.int64)
+            cur_sim = np.full((len(rows), k), -np.inf, dtype=np.float32)
+            for gi in range(n_groups):
+                hit = np.nonzero(chosen[:, gi])[0]
+                if not len(hit):
+                    continue
+                c0, c1 = self.group_start[g0 + gi], self.group_end[g0 + gi]
+                S = E[rows[hit]] @ self.child_mat[c0:c1].T
+                best[hit] = np.maximum(best[hit], S.max(axis=1))
+                loc_idx, loc_sim = topk_columns(S, k)
+                glob_idx = np.where(loc_idx >= 0, self.col_order[c0 + np.maximum(loc_idx, 0)], -1)
+                pad = k - loc_idx.shape[1]
+                if pad:
+                    glob_idx = np.pad(glob_idx, ((0, 0), (0, pad)), constant_values=-1)
+                    loc_sim = np.pad(loc_sim, ((0, 0), (0, pad)), constant_values=-np.inf)
+                cur_idx[hit], cur_sim[hit] = _merge_topk(cur_idx[hit], cur_sim[hit], glob_idx, loc_sim, k)
+            slot_max[rows, slots] = best
+            slot_idx[rows, slots] = cur_idx
+            slot_sim[rows, slots] = cur_sim
+
+        r = np.arange(b)
+        best_slot = np.argmax(slot_max, axis=1)
+        best_sim = slot_max[r, best_slot].astype(np.float64)
+        if s > 1:
+            rest = slot_max.copy()
+            rest[r, best_slot] = -np.inf
+            second_sim = rest.max(axis=1).astype(np.float64)
+        else:
+            second_sim = np.full(b, -1.0)
+        return {
+            "best_parent": sl[r, best_slot],
+            "best_sim": best_sim,
+            "second_sim": second_sim,
+            "child_idx": slot_idx[r, best_slot],
+            "child_sim": slot_sim[r, best_slot].astype(np.float64),
+        }
+
+    def score(self, em_emb, k=None, shortlist=None, group_shortlist=None, block_rows=None):
+        """Statistics compatible with assign.build_assignment_frame, computed through the index."""
+        k = int(max(0, min(config.TOPK_CHILD if k is None else k, len(self.tax_paths))))
+        shortlist = config.ASSIGN_INDEX_PARENT_SHORTLIST if shortlist is None else shortlist
+        if group_shortlist is None:
+            group_shortlist = config.ASSIGN_INDEX_GROUP_SHORTLIST if self.deep else 0
+        E = _unit_rows(em_emb)
+        per_row = self.n_parents + max(shortlist, 1) * len(self.tax_paths) / max(self.n_parents, 1)
+        step = block_rows_for(per_row, block_rows)
+        parts = [self._score_block(E[i:i + step], shortlist, group_shortlist, k) for i in range(0, len(E), step)]
+        if not parts:
+            return {"best_parent": np.zeros(0, dtype=np.int64), "best_sim": np.zeros(0), "second_sim": np.zeros(0),
+                    "child_idx": np.zeros((0, k), dtype=np.int64), "child_sim": np.zeros((0, k))}
+        return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def check_recall(index: HierarchicalIndex, em_emb, tax_emb, sample=None, seed=0, **score_kw):
+    """Compare index scoring against exact scoring on (a sample of) incidents."""
+    em_emb = np.asarray(em_emb)
+    rows = np.arange(len(em_emb))
+    if sample and sample < len(rows):
+        rows = np.sort(np.random.default_rng(seed).choice(rows, size=int(sample), replace=False))
+    k = score_kw.get("k")
+    k = config.TOPK_CHILD if k is None else k
+    _, codes = parent_groups(index.tax_paths)
+    exact = score_blocked(em_emb[rows], tax_emb, codes, index.n_parents, k)
+    approx = index.score(em_emb[rows], **score_kw)
+    ex_sets = [set(r[r >= 0].tolist()) for r in exact["child_idx"]]
+    ap_sets = [set(r[r >= 0].tolist()) for r in approx["child_idx"]]
+    found = sum(len(a & e) for a, e in zip(ap_sets, ex_sets))
+    total = sum(len(e) for e in ex_sets)
+    return {
+        "n_checked": int(len(rows)),
+        "parent_recall": float(np.mean(exact["best_parent"] == approx["best_parent"])) if len(rows) else 1.0,
+        "child_top1_agreement": float(np.mean(exact["child_idx"][:, :1] == approx["child_idx"][:, :1])) if len(rows) else 1.0,
+        "child_recall_at_k": (found / total) if total else 1.0,
+        "max_parent_sim_gap": float(np.max(exact["best_sim"] - approx["best_sim"])) if len(rows) else 0.0,
+    }
@@ -0,0 +1,121 @@
+"""
+Interned taxonomy path tree: each distinct path string is split once (as utils.split_any does) and
+every prefix becomes a node with a parent pointer, depth, root node, leaf label and its ancestor per
+depth in flat arrays, so stages look up parent / leaf / prefix by node id instead of re-splitting
+strings per row.
+
+A run (or service Classifier) builds one tree from its taxonomy paths and passes it to the stages,
+which intern the consolidated paths they see; stage functions called without one use a throwaway
+tree. A tree is not thread-safe: share it only within one thread.
+"""
+from array import array
+import numpy as np
+import pandas as pd
+from utils import split_any
+
+
+class PathTree:
+    def __init__(self, paths=()):
+        self.labels = []             # label id -> segment text
+        self._label_ids = {}
+        self.parent = array("q")     # node -> parent node (-1 for a top-level segment)
+        self.depth = array("q")      # node -> number of segments
+        self.label = array("q")      # node -> label id of its last segment
+        self.root = array("q")       # node -> its depth-1 ancestor
+        self._anc = []               # node -> (ancestor at depth 1, ..., node)
+        self._child = {}             # (parent node, label id) -> node
+        self._path = []              # node -> canonical ' > '-joined path
+        self._by_text = {}           # raw path string -> node (-1: no segments)
+        self._np = (0, None, None)   # (size, label, root) int64 copies for the vectorized lookups
+        for p in paths:
+            self.add(p)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _intern(self, parts):
+        node = -1
+        for seg in parts:
+            lid = self._label_ids.get(seg)
+            if lid is None:
+                lid = self._label_ids[seg] = len(self.labels)
+                self.labels.append(seg)
+            child = self._child.get((node, lid))
+            if child is None:
+                child = self._child[(node, lid)] = len(self.parent)
+                self.parent.append(node)
+                self.depth.append(self.depth[node] + 1 if node >= 0 else 1)
+                self.label.append(lid)
+                self.root.append(self.root[node] if node >= 0 else child)
+                self._anc.append(self._anc[node] + (child,) if node >= 0 else (child,))
+                self._path.append(self._path[node] + " > " + seg if node >= 0 else seg)
+            node = child
+        return node
+
+    def add(self, path):
+        """Node id of `path`, interning it and its prefixes; -1 when it has no segments."""
+        key = str(path)
+        node = self._by_text.get(key)
+        if node is None:
+            node = self._by_text[key] = self._intern(split_any(key))
+        return node
+
+    def ids(self, paths):
+        """Node id per entry of `paths` (an int64 array); each distinct string is looked up once."""
+        codes, uniques = pd.factorize(pd.Series(paths, dtype=object), use_na_sentinel=False)
+        return np.array([self.add(p) for p in uniques], dtype=np.int64)[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+
+    # --- per node ---
+    def path(self, node):
+        return self._path[node] if node >= 0 else ""
+
+    def leaf(self, node):
+        return self.labels[self.label[node]] if node >= 0 else None
+
+    def root_label(self, node):
+        return self.labels[self.label[self.root[node]]] if node >= 0 else None
+
+    def prefix(self, node, d):
+        """Ancestor of `node` at depth d (node itself when it is no deeper than d, -1 for d < 1)."""
+        if node < 0 or d >= self.depth[node]:
+            return node
+        return self._anc[node][d - 1] if d >= 1 else -1
+
+    def parts(self, node):
+        """Segments root..leaf as a new list (like utils.split_any of the path)."""
+        out = []
+        while node >= 0:
+            out.append(self.labels[self.label[node]])
+            node = self.parent[node]
+        return out[::-1]
+
+    def parent_path(self, node):
+        """' > '-joined path of the parent, None for top-level (or empty) paths."""
+        return self._path[self.parent[node]] if node >= 0 and self.parent[node] >= 0 else None
+
+    # --- vectorized over node arrays (-1 entries get `missing`) ---
+    def _arrays(self):
+        # copies, not np.frombuffer views: a live view would make the next append raise BufferError
+        if self._np[0] != len(self.parent):
+            self._np = (len(self.parent), np.array(self.label, dtype=np.int64), np.array(self.root, dtype=np.int64))
+        return self._np[1], self._np[2]
+
+    def _labels_of(self, nodes, via_root, missing):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        out = np.full(len(nodes), missing, dtype=object)
+        ok = nodes >= 0
+        if ok.any():
+            lab, root = self._arrays()
+            target = root[nodes[ok]] if via_root else nodes[ok]
+            out[ok] = np.asarray(self.labels, dtype=object)[lab[target]]
+        return out
+
+    def leaf_labels(self, nodes, missing=None):
+        return self._labels_of(nodes, False, missing)
+
+    def root_labels(self, nodes, missing=None):
+        return self._labels_of(nodes, True, missing)
+
+    def parent_paths(self, nodes):
+        return np.array([self.parent_path(n) for n in np.asarray(nodes, dtype=np.int64).tolist()], dtype=object)
+
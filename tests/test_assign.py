@@ -0,0 +1,85 @@
+"""assign_hierarchical against the original per-incident loop on hand-built embeddings."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import config
+from assign import assign_hierarchical, ASSIGN_COLUMNS
+from utils import split_any
+
+
+def _reference(em, id_col, tax_paths, em_emb, tax_emb):
+    """The per-row implementation assign_hierarchical replaced (cosine via numpy instead of sklearn)."""
+    unit = lambda x: x / np.linalg.norm(x, axis=1, keepdims=True)
+    S = unit(np.asarray(em_emb, dtype=np.float64)) @ unit(np.asarray(tax_emb, dtype=np.float64)).T
+    parent_to_idx = {}
+    for j, p in enumerate(tax_paths):
+        parts = split_any(p)
+        parent_to_idx.setdefault(parts[0] if parts else "UNCAT", []).append(j)
+    rows = []
+    for i, inc_id in enumerate(em[id_col].tolist()):
+        sims = S[i]
+        parent_ranked = sorted(((p, float(np.max(sims[idxs]))) for p, idxs in parent_to_idx.items()), key=lambda x: x[1], reverse=True)
+        best_parent, best_parent_sim = parent_ranked[0]
+        second_parent_sim = parent_ranked[1][1] if len(parent_ranked) > 1 else -1.0
+        margin = best_parent_sim - second_parent_sim
+        base = {"Accident ID": inc_id, "Selected": True, "Parent_Sim": best_parent_sim, "Parent_Margin": margin}
+        if best_parent_sim < config.PARENT_MIN_SIM:
+            rows.append({**base, "Final_Category_Path": "UNCAT", "Cosine": best_parent_sim, "Rank": 1,
+                         "Below_UNCAT_Threshold": True, "Parent": "UNCAT", "Parent_LowConf": True})
+            continue
+        idxs_sorted = sorted(parent_to_idx[best_parent], key=lambda j: sims[j], reverse=True)
+        child_best = float(sims[idxs_sorted[0]])
+        selected = []
+        for j in idxs_sorted:
+            if len(selected) >= config.TOPK_CHILD:
+                break
+            if sims[j] >= config.CHILD_MIN_SIM or (child_best - sims[j] <= config.CHILD_MARGIN):
+                selected.append(j)
+        for rank, j in enumerate(selected, start=1):
+            rows.append({**base, "Final_Category_Path": tax_paths[j], "Cosine": float(sims[j]), "Rank": rank,
+                         "Below_UNCAT_Threshold": False, "Parent": best_parent, "Parent_LowConf": margin < config.PARENT_MARGIN})
+    return pd.DataFrame(rows, columns=ASSIGN_COLUMNS)
+
+
+@pytest.fixture
+def case():
+    rng = np.random.default_rng(11)
+    tax_paths = ["A > a1", "A > a2", "A > a3", "B > b1", "B > b2", "C > c1 > x", "A > a4", "D"]
+    tax = rng.normal(size=(len(tax_paths), 8))
+    tax[1] = tax[0]                      # child tie inside A: lower column first
+    tax[3] = tax[0]                      # parent tie A/B: first-seen parent wins
+    tax[6] = 0.999 * tax[0] + 0.001 * tax[2]
+    em_emb = rng.normal(size=(12, 8))
+    em_emb[0] = tax[0]                   # exact hit on the tied vectors
+    em_emb[1] = tax[5]
+    em_emb[2] = -tax.sum(axis=0)         # below PARENT_MIN_SIM -> UNCAT
+    em_emb[3] = em_emb[0]                # duplicate text
+    em = pd.DataFrame({"Accident ID": [100 + i for i in range(12)], "_emars_text_": ["t"] * 12})
+    return em, tax_paths, tax, em_emb
+
+
+@pytest.mark.parametrize("blocked", [True, False])
+@pytest.mark.parametrize("topk", [1, 3])
+def test_matches_per_row_reference(case, monkeypatch, blocked, topk):
+    if not blocked:
+        pytest.importorskip("sklearn")
+    em, tax_paths, tax, em_emb = case
+    monkeypatch.setattr(config, "ASSIGN_USE_INDEX", False)
+    monkeypatch.setattr(config, "ASSIGN_BLOCKED", blocked)
+    monkeypatch.setattr(config, "TOPK_CHILD", topk)
+    monkeypatch.setattr(config, "CHILD_MIN_SIM", 0.2)
+    got = assign_hierarchical(em, "Accident ID", tax_paths, em_emb, tax)
+    exp = _reference(em, "Accident ID", tax_paths, em_emb, tax)
+    assert got["Parent"].eq("UNCAT").any() and (got["Rank"] > 1).any() == (topk > 1)
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), exp, check_dtype=False, rtol=1e-5)
+
+
+def test_deduplicated_texts_fan_out(case, monkeypatch):
+    em, tax_paths, tax, em_emb = case
+    monkeypatch.setattr(config, "ASSIGN_USE_INDEX", False)
+    text_index = np.array([0, 1, 2, 0] + list(range(3, 11)))
+    uniq = np.delete(em_emb, 3, axis=0)
+    got = assign_hierarchical(em, "Accident ID", tax_paths, uniq, tax, text_index=text_index)
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), _reference(em, "Accident ID", tax_paths, em_emb, tax),
+                                  check_dtype=False, rtol=1e-5)
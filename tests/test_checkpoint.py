@@ -0,0 +1,21 @@
+"""checkpoint.resolve_stages: which stages resume_from/only recompute and run."""
+import pytest
+
+from checkpoint import STAGE_ORDER, resolve_stages
+
+
+def test_resolve_stages():
+    assert resolve_stages() == (set(), None)
+    assert resolve_stages(resume_from="evidence") == ({"evidence", "rendered"}, None)
+    force, wanted = resolve_stages(only=["raw"])
+    assert force == {"raw"} and wanted == {"embeddings", "raw"}
+    force, wanted = resolve_stages(resume_from="consolidated", only=["raw"])
+    assert force == {"raw", "consolidated", "evidence", "rendered"} and wanted == {"embeddings", "raw"}
+    assert resolve_stages(only=[STAGE_ORDER[-1]])[1] == set(STAGE_ORDER)
+
+
+def test_resolve_stages_rejects_unknown_stage():
+    with pytest.raises(ValueError):
+        resolve_stages(only=["bogus"])
+    with pytest.raises(ValueError):
+        resolve_stages(resume_from="bogus")
@@ -0,0 +1,202 @@
+"""TermMatcher and apply_evidence_gate against the original per-term / per-row versions on hand-built frames."""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import config
+from evidence import TermMatcher, apply_evidence_gate, _term_candidates, _normalize_term
+from tax_tree import PathTree
+from utils import _clean_desc_text, split_any
+
+
+def _reference_term_in_desc(term, desc_norm, path=""):
+    """The per-term check TermMatcher replaced (substring, then alias candidates, then word boundaries)."""
+    if not term: return False
+    if term in desc_norm: return True
+    for cand in _term_candidates(term, path=path):
+        if cand in desc_norm: return True
+        if re.search(r"\b" + re.escape(cand) + r"\b", desc_norm):
+            return True
+    return False
+
+
+def _reference_match(terms, desc_norm):
+    return {t for t in terms if _reference_term_in_desc(t, desc_norm)}
+
+
+TERMS = ["leak", "leakage", "pump", "pumps", "ump", "seal", "sealing", "explosion", "cl2", "oil spill",
+         "valve", "alve", "abcd", "bcde", "flange leak"]
+
+DESCS = [
+    "",
+    "leakage at the flange",                   # longest hit 'leakage' implies 'leak'
+    "pumps tripped",                           # 'pumps' implies 'pump' and the inner 'ump'
+    "sealing failed on valve",                 # 'sealing' implies 'seal'; 'valve' implies 'alve'
+    "a release of oil from the tank",          # alias of 'leakage' and phrase alias of 'oil spill'
+    "blast in the compressor house",           # token alias of 'explosion'
+    "chlorine cloud",                          # symbol alias of 'cl2'
+    "abcde",                                   # overlapping hits at different start positions
+    "flange leak near pump",
+    "leaking drum",                            # alias 'leaking' of 'leakage' plus substring 'leak'
+    "nothing to see here",
+]
+
+
+@pytest.mark.parametrize("desc", DESCS)
+def test_matcher_equals_per_term_check(desc):
+    desc_n = _normalize_term(desc)
+    assert TermMatcher(TERMS).match(desc_n) == _reference_match(TERMS, desc_n)
+
+
+def test_matcher_random_descriptions():
+    rng = np.random.default_rng(7)
+    words = ["leak", "age", "pump", "s", "seal", "ing", "oil", "spill", "release", "of", "blast", "chlorine", "ab", "cde",
+             "valve", "flange", "x"]
+    matcher = TermMatcher(TERMS)
+    for _ in range(300):
+        picked = rng.choice(words, size=rng.integers(1, 8))
+        glue = rng.choice(["", " "], size=len(picked))
+        desc_n = _normalize_term("".join(w + g for w, g in zip(picked, glue)))
+        assert matcher.match(desc_n) == _reference_match(TERMS, desc_n), desc_n
+
+
+def test_matcher_from_cache_and_empty_terms():
+    cache = {"A > Leak": ["leak"], "B > Pump": ["pump", "pumps"], "C": []}
+    assert TermMatcher.from_cache(cache).match("pumps leaked") == {"leak", "pump", "pumps"}
+    assert TermMatcher([]).match("pumps leaked") == set()
+    assert TermMatcher(["", "leak"]).match("") == set()
+
+
+def _reference_gate(assign_df, em_df, path_term_cache):
+    """The iterrows gate apply_evidence_gate replaced (parent backoff, then downgrade of failures to UNCAT)."""
+    def parent_path(path):
+        parts = split_any(path)
+        return " > ".join(parts[:-1]) if len(parts) > 1 else None
+
+    desc_map_raw = dict(zip(em_df.iloc[:, 0].tolist(), em_df["_emars_text_"].astype(str).tolist()))
+    desc_map_norm = {k: _normalize_term(_clean_desc_text(v)) for k, v in desc_map_raw.items()}
+    ev_rows = []
+    for _, r in assign_df.iterrows():
+        inc_id = r["Accident ID"]
+        path = str(r.get("Consolidated_Path", r.get("Final_Category_Path", "UNCAT")))
+        cosv = float(r.get("Cosine", 0.0))
+        if path == "UNCAT":
+            ev_rows.append({**r, "Evidence_Pass": True, "Evidence_Reason": "pre_uncat"})
+            continue
+        expected_terms = path_term_cache.get(path, [])
+        desc_n = desc_map_norm.get(inc_id, "")
+        matched = [t for t in expected_terms if _reference_term_in_desc(t, desc_n, path=path)]
+        exp_n = len(expected_terms)
+        cov = (len(matched) / exp_n) if exp_n > 0 else np.nan
+        if exp_n == 0:
+            ev_pass = cosv >= float(config.EVIDENCE_FALLBACK_COSINE)
+            reason = "fallback_cosine" if ev_pass else "reject_fallback_cosine"
+        else:
+            ev_pass = len(matched) >= int(config.EVIDENCE_MIN_MATCHED_TERMS) and cov >= float(config.EVIDENCE_COVERAGE_MIN)
+            reason = "pass_expected_terms" if ev_pass else "reject_expected_terms"
+        chosen_path = path
+        chosen = {"expected_terms": expected_terms, "matched": matched, "cov": cov, "ev_pass": ev_pass}
+        if not ev_pass and config.ENABLE_PARENT_BACKOFF:
+            pp = parent_path(path)
+            if pp:
+                p_expected = path_term_cache.get(pp, [])
+                p_matched = [t for t in p_expected if _reference_term_in_desc(t, desc_n, path=pp)]
+                p_exp_n = len(p_expected)
+                p_cov = (len(p_matched) / p_exp_n) if p_exp_n > 0 else np.nan
+                p_pass = ((p_exp_n > 0 and len(p_matched) >= int(config.PARENT_BACKOFF_MIN_MATCHED_TERMS)
+                           and p_cov >= float(config.PARENT_BACKOFF_COVERAGE_MIN))
+                          or (p_exp_n == 0 and cosv >= float(config.PARENT_BACKOFF_MIN_COSINE)))
+                if p_pass:
+                    chosen_path = pp
+                    reason = "accept_parent_backoff"
+                    chosen = {"expected_terms": p_expected, "matched": p_matched, "cov": p_cov, "ev_pass": p_pass}
+        ev_rows.append({
+            **r,
+            "Final_Category_Path": chosen_path,
+            "Consolidated_Path": chosen_path,
+            "Evidence_Expected_Terms": " | ".join(chosen["expected_terms"]),
+            "Evidence_Matched_Terms": " | ".join(chosen["matched"]),
+            "Evidence_Matched_Count": len(chosen["matched"]),
+            "Evidence_Expected_Count": len(chosen["expected_terms"]),
+            "Evidence_Coverage": chosen["cov"],
+            "Evidence_Pass": bool(chosen["ev_pass"]),
+            "Evidence_Reason": reason,
+            "Description_Full": desc_map_raw.get(inc_id, ""),
+        })
+    ev = pd.DataFrame(ev_rows)
+    fail_mask = (ev["Consolidated_Path"] != "UNCAT") & (ev["Evidence_Pass"] == False)
+    ev.loc[fail_mask, "Consolidated_Path"] = "UNCAT"
+    ev.loc[fail_mask, "Final_Category_Path"] = "UNCAT"
+    ev.loc[fail_mask, "Evidence_Reason"] = ev.loc[fail_mask, "Evidence_Reason"] + " -> downgraded_to_uncat"
+    supported = ev[(ev["Consolidated_Path"] == "UNCAT") | (ev["Evidence_Pass"] == True)].copy()
+    supported = supported.sort_values(["Accident ID", "Cosine"], ascending=[True, False]).copy()
+    supported["Rank"] = supported.groupby("Accident ID").cumcount() + 1
+    return supported
+
+
+GATE_CACHE = {
+    "Loss > Seal > Flange leak": ["flange", "leak"],
+    "Loss > Seal > Gasket": ["gasket"],
+    "Loss > Seal": ["seal"],
+    "Fire > Pool fire": ["pool"],
+    "Fire > Jet fire": [],
+    "Rotating > Pump": ["pump"],
+    "Solo": ["solo"],
+}
+
+# (incident, consolidated path, cosine) -> branch exercised
+GATE_ROWS = [
+    (1, "Loss > Seal > Flange leak", 0.61),   # both terms found: pass
+    (1, "Loss > Seal > Gasket", 0.40),        # term missing, parent 'seal' found: parent backoff
+    (2, "Loss > Seal > Gasket", 0.55),        # term and parent term missing: downgraded
+    (2, "Fire > Jet fire", 0.52),             # no expected terms: fallback cosine passes
+    (3, "Fire > Jet fire", 0.40),             # fallback cosine rejects, below the backoff floor too: downgraded
+    (3, "Fire > Pool fire", 0.47),            # term missing, parent 'Fire' has no cache entry, cosine >= backoff floor
+    (4, "Fire > Pool fire", 0.30),            # same, cosine below the backoff floor: downgraded
+    (4, "Solo", 0.70),                        # term missing, no parent: downgraded
+    (5, "UNCAT", 0.20),                       # pre_uncat
+    (5, "Rotating > Pump", 0.66),             # 'pumps' implies 'pump': pass
+    (6, "Rotating > Pump", 0.38),             # incident missing from em_df: empty description, downgraded
+    (7, "Unlisted > Path", 0.51),             # path absent from the cache: fallback cosine
+]
+
+GATE_TEXTS = {
+    1: "Flange leak at the seal of line 4",
+    2: "operator noticed smoke",
+    3: "burning liquid in bund",
+    4: "unit tripped",
+    5: "Pumps cavitating",
+    7: "unlisted event",
+}
+
+
+def _gate_frames(rows):
+    assign = pd.DataFrame(rows, columns=["Accident ID", "Consolidated_Path", "Cosine"])
+    assign.insert(1, "Final_Category_Path", assign["Consolidated_Path"])
+    assign["Rank"] = assign.groupby("Accident ID").cumcount() + 1
+    em = pd.DataFrame({"Accident ID": list(GATE_TEXTS), "_emars_text_": list(GATE_TEXTS.values())})
+    return assign, em
+
+
+@pytest.mark.parametrize("rows", [GATE_ROWS, GATE_ROWS[8:] + GATE_ROWS[:8], GATE_ROWS[8:9]],
+                         ids=["gated_first", "uncat_first", "uncat_only"])
+def test_gate_equals_per_row_gate(rows):
+    assign, em = _gate_frames(rows)
+    got = apply_evidence_gate(assign, em, GATE_CACHE, tree=PathTree())
+    want = _reference_gate(assign, em, GATE_CACHE)
+    pd.testing.assert_frame_equal(got, want)
+
+
+def test_gate_branches_covered():
+    assign, em = _gate_frames(GATE_ROWS)
+    reasons = set(apply_evidence_gate(assign, em, GATE_CACHE)["Evidence_Reason"])
+    assert {"pass_expected_terms", "accept_parent_backoff", "fallback_cosine", "pre_uncat",
+            "reject_expected_terms -> downgraded_to_uncat", "reject_fallback_cosine -> downgraded_to_uncat"} <= reasons
+
+
+def test_gate_with_prebuilt_matcher():
+    assign, em = _gate_frames(GATE_ROWS)
+    got = apply_evidence_gate(assign, em, GATE_CACHE, TermMatcher.from_cache(GATE_CACHE))
+    pd.testing.assert_frame_equal(got, _reference_gate(assign, em, GATE_CACHE))
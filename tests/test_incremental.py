@@ -0,0 +1,84 @@
+"""RunState diff/merge and the flipped-parent recheck on synthetic frames."""
+import pandas as pd
+import pytest
+
+from state import RunState
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=["Accident ID", "Consolidated_Path"])
+
+
+def _state(tmp_path, hashes, consolidated=None):
+    st = RunState(str(tmp_path))
+    st.hashes = hashes
+    if consolidated is not None:
+        st.frames = {"consolidated": consolidated}
+    return st
+
+
+def test_diff_splits_added_changed_removed_unchanged(tmp_path):
+    st = _state(tmp_path, {1: "a", 2: "b", 3: "c"})
+    added, changed, removed, unchanged = st.diff({1: "a", 2: "B", 4: "d"})
+    assert (added, changed, removed, unchanged) == ({4}, {2}, {3}, {1})
+
+
+def test_merge_keeps_unchanged_rows_and_appends_delta(tmp_path):
+    prev = _frame([(1, "A > B"), (2, "A > C"), (3, "A > D")])
+    st = _state(tmp_path, {1: "a", 2: "b", 3: "c"}, prev)
+    delta = _frame([(2, "A > E"), (4, "A > F")])
+    merged = st.merge("consolidated", delta, {1})
+    assert merged.values.tolist() == [[1, "A > B"], [2, "A > E"], [4, "A > F"]]
+    assert merged.index.tolist() == [0, 1, 2]
+
+
+def test_merge_without_delta_returns_kept_rows(tmp_path):
+    st = _state(tmp_path, {1: "a", 2: "b"}, _frame([(1, "A > B"), (2, "A > C")]))
+    assert st.merge("consolidated", None, {2}).values.tolist() == [[2, "A > C"]]
+
+
+def test_merge_empty_delta_without_previous_state(tmp_path):
+    st = _state(tmp_path, {})
+    merged = st.merge("consolidated", None, set())
+    assert merged.empty and "Accident ID" in merged.columns
+    assert st.merge("consolidated", _frame([]), set()).empty
+
+
+def test_parent_flipped_ids_parent_entering_and_leaving(tmp_path):
+    prev = _frame([(1, "A > B > C"), (2, "A > X"), (3, "A > Y"), (4, "A > Y > Z"), (5, "A > Q > R"), (6, "UNCAT")])
+    st = _state(tmp_path, {}, prev)
+    assign = _frame([
+        (1, "A > B > C"),   # unchanged; parent "A > B" enters through incident 2
+        (2, "A > B"),       # delta
+        (4, "A > Y > Z"),   # unchanged; parent "A > Y" left with removed incident 3
+        (5, "A > Q > R"),   # unchanged; parent never assigned
+        (6, "UNCAT"),
+    ])
+    assert st.parent_flipped_ids(assign, {1, 4, 5, 6}) == {1, 4}
+
+
+def test_parent_flipped_ids_without_previous_state(tmp_path):
+    st = _state(tmp_path, {})
+    assign = _frame([(1, "A > B"), (2, "A > B > C")])
+    assert st.parent_flipped_ids(assign, {2}) == {2}
+    assert st.parent_flipped_ids(assign, set()) == set()
+
+
+
+def test_save_replaces_state_atomically(tmp_path, monkeypatch):
+    frames = {s: _frame([(1, "A > B")]) for s in ("raw", "consolidated", "evidence")}
+    RunState(str(tmp_path)).save("fp", {1: "a"}, frames)
+
+    # a crash while writing the next state's frames leaves the previous state loadable
+    def crash(self, path, *a, **kw):
+        raise OSError("disk full")
+    monkeypatch.setattr(pd.DataFrame, "to_pickle", crash)
+    with pytest.raises(OSError):
+        RunState(str(tmp_path)).save("fp", {1: "b"}, {s: _frame([(1, "A > C")]) for s in frames})
+    monkeypatch.undo()
+    st = RunState.load(str(tmp_path), "fp")
+    assert st.hashes == {1: "a"} and st.frames["evidence"].values.tolist() == [[1, "A > B"]]
+
+    st.save("fp", {2: "c"}, {s: _frame([(2, "A > D")]) for s in frames})
+    assert sorted(p.name.split("_")[0] for p in tmp_path.glob("*.pkl")) == ["consolidated", "evidence", "raw"]
+    assert RunState.load(str(tmp_path), "fp").frames["raw"].values.tolist() == [[2, "A > D"]]
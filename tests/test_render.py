@@ -0,0 +1,128 @@
+"""depth_aware_render against the original per-row render on hand-built frames."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import config
+import render
+from render import depth_aware_render, leaf_support_counts
+from tax_tree import PathTree
+from utils import split_any, _fnum
+
+
+def _reference(assign_df, enabled=True):
+    """The apply(axis=1) render depth_aware_render replaced (two merges to attach LeafSupport)."""
+    assign = assign_df.copy()
+    assign["Consolidated_Path_Full"] = assign["Consolidated_Path"]
+    tmp = assign[assign["Consolidated_Path_Full"].astype(str) != "UNCAT"].copy()
+    tmp["__parts"] = tmp["Consolidated_Path_Full"].map(lambda s: split_any(s))
+    tmp["__parent"] = tmp["__parts"].map(lambda z: z[0] if len(z) else "")
+    tmp["__leaf"] = tmp["__parts"].map(lambda z: z[-1] if len(z) else "")
+    leaf_support = (tmp.groupby(["__parent", "__leaf"])["Accident ID"].nunique().rename("LeafSupport").reset_index())
+    tmp = tmp.merge(leaf_support, on=["__parent", "__leaf"], how="left")
+    assign = assign.merge(tmp[["Accident ID", "Consolidated_Path_Full", "LeafSupport"]].drop_duplicates(),
+                          on=["Accident ID", "Consolidated_Path_Full"], how="left")
+
+    def _allowed_depth(row):
+        p = str(row.get("Consolidated_Path_Full", "UNCAT"))
+        if p == "UNCAT": return 0
+        cos = _fnum(row.get("Cosine", 0.0), 0.0)
+        cov = _fnum(row.get("Evidence_Coverage", 0.0), 0.0)
+        conf = 0.72 * cos + 0.28 * cov
+        d = 1
+        if conf >= 0.45 and cov >= 0.10: d = 2
+        if conf >= 0.54 and cov >= 0.22: d = 3
+        if conf >= 0.62 and cov >= 0.32: d = 4
+        return int(min(max(d, 1), int(config.MAX_DEPTH_RENDER)))
+
+    def _render_path(row):
+        p = str(row.get("Consolidated_Path_Full", "UNCAT"))
+        if p == "UNCAT": return "UNCAT"
+        parts = split_any(p)
+        if not parts: return "UNCAT"
+        d = int(max(1, min(len(parts), row.get("AllowedDepth", 1))))
+        if d < len(parts):
+            return " > ".join(parts[:d] + [config.DEPTH_CAP_LABEL])
+        ls = row.get("LeafSupport", None)
+        leaf = str(parts[-1]).strip().lower()
+        if len(parts) >= 3 and leaf != "other":
+            if (ls is not None) and int(ls) < int(config.MIN_LEAF_SUPPORT_RENDER):
+                return " > ".join(parts[:-1] + [config.LOW_SUPPORT_LABEL])
+        return " > ".join(parts)
+
+    if enabled:
+        assign["AllowedDepth"] = assign.apply(_allowed_depth, axis=1)
+        assign["Consolidated_Path_Render"] = assign.apply(_render_path, axis=1)
+    else:
+        assign["AllowedDepth"] = None
+        assign["Consolidated_Path_Render"] = assign["Consolidated_Path_Full"]
+    return assign
+
+
+PATHS = [
+    "Loss > Seal > Flange leak",          # depth 3: full, low-support or capped
+    "Loss > Seal > Gasket",
+    "Loss > Seal > OTHER",                # 'other' leaf never gets the low-support label
+    "Loss > Seal",
+    "Loss",
+    "Fire > Pool > Bund > Overflow",      # deeper than MAX_DEPTH_RENDER: always capped
+    "Rotating / Pump / Bearing failure",  # '/' separated
+    "Other > Seal > Gasket",              # same leaf as above under another parent
+]
+
+
+def _frame(seed, n_rows=60):
+    rng = np.random.default_rng(seed)
+    pool = PATHS + ["UNCAT"]
+    df = pd.DataFrame({
+        "Accident ID": rng.integers(1, 16, size=n_rows),
+        "Consolidated_Path": rng.choice(pool, size=n_rows),
+        "Cosine": rng.uniform(0.3, 0.8, size=n_rows).round(3),
+        "Evidence_Coverage": rng.choice([np.nan, 0.0, 0.1, 0.25, 0.34, 0.5, 1.0], size=n_rows),
+    })
+    df["Rank"] = df.groupby("Accident ID").cumcount() + 1
+    return df.sort_values(["Accident ID", "Cosine"], ascending=[True, False]).drop_duplicates(["Accident ID", "Consolidated_Path"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_render_equals_per_row_render(seed):
+    df = _frame(seed)
+    got = depth_aware_render(df, tree=PathTree())
+    pd.testing.assert_frame_equal(got, _reference(df))
+
+
+def test_render_branches():
+    rows = [
+        (1, "Loss > Seal > Gasket", 0.80, 0.50),                 # full depth, support 1: low support
+        (2, "Loss > Seal > Flange leak", 0.80, 0.50),            # full depth, support 3: kept
+        (3, "Loss > Seal > Flange leak", 0.80, 0.50),
+        (4, "Loss > Seal > Flange leak", 0.80, 0.50),
+        (5, "Loss > Seal > OTHER", 0.80, 0.50),                  # 'other' leaf is never relabelled
+        (6, "Loss > Seal > Flange leak", 0.60, 0.15),            # depth 2: capped
+        (7, "Fire > Pool > Bund > Overflow", 0.90, 0.90),        # deeper than MAX_DEPTH_RENDER: capped
+        (8, "UNCAT", 0.20, np.nan),
+        (9, "Loss", 0.30, 0.0),
+        (2, "Rotating / Pump / Bearing failure", 0.90, np.nan),  # missing coverage counts as 0: depth 1
+    ]
+    df = pd.DataFrame(rows, columns=["Accident ID", "Consolidated_Path", "Cosine", "Evidence_Coverage"])
+    got = depth_aware_render(df)
+    pd.testing.assert_frame_equal(got, _reference(df))
+    cap, low = config.DEPTH_CAP_LABEL, config.LOW_SUPPORT_LABEL
+    assert got["Consolidated_Path_Render"].tolist() == [
+        f"Loss > Seal > {low}", "Loss > Seal > Flange leak", "Loss > Seal > Flange leak", "Loss > Seal > Flange leak",
+        "Loss > Seal > OTHER", f"Loss > Seal > {cap}", f"Fire > Pool > Bund > {cap}", "UNCAT", "Loss", f"Rotating > {cap}"]
+
+
+def test_render_with_precomputed_support():
+    df = _frame(3)
+    tree = PathTree()
+    got = depth_aware_render(df, leaf_support=leaf_support_counts(df, tree), tree=tree)
+    pd.testing.assert_frame_equal(got, _reference(df))
+
+
+def test_render_uncat_only_and_disabled(monkeypatch):
+    df = pd.DataFrame({"Accident ID": [1, 2], "Consolidated_Path": ["UNCAT", "UNCAT"], "Cosine": [0.2, 0.3]})
+    pd.testing.assert_frame_equal(depth_aware_render(df), _reference(df))
+    monkeypatch.setattr(render, "ENABLE_DEPTH_AWARE_RENDER", False)
+    df = _frame(1)
+    pd.testing.assert_frame_equal(depth_aware_render(df), _reference(df, enabled=False))
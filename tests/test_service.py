@@ -0,0 +1,55 @@
+"""The warm service gates an incident of its seed export exactly as run_all's evidence stage did."""
+import os
+
+import pytest
+
+import config
+from benchmark import HashingModel, generate
+from data import load_emars, load_taxonomy
+from embeddings import encode_texts
+from assign import assign_hierarchical
+from consolidate import consolidate_and_disambiguate
+from evidence import prepare_expected_terms_cache, apply_evidence_gate
+from writer import OutputWriter, OUTPUT_NAMES
+
+
+@pytest.fixture
+def seeded(tmp_path, monkeypatch):
+    pytest.importorskip("openpyxl")
+    monkeypatch.setattr(config, "ENABLE_EMBED_CACHE", False)
+    monkeypatch.setattr(config, "ASSIGN_USE_INDEX", False)
+    monkeypatch.setattr(config, "EXCEL_CACHE_DIR", str(tmp_path / "excel"))
+    em_xlsx, tax_xlsx = generate(0.1, 300, seed=3, bench_dir=str(tmp_path))
+    em, id_col, _, _ = load_emars(em_xlsx)
+    _, _, tax_paths = load_taxonomy(tax_xlsx)
+    model = HashingModel()
+    tax_emb = encode_texts(model, tax_paths, show_progress_bar=False)
+    em_emb = encode_texts(model, em["_emars_text_"].tolist(), show_progress_bar=False)
+    cons = consolidate_and_disambiguate(assign_hierarchical(em, id_col, tax_paths, em_emb, tax_emb), em, id_col)
+    path_term_cache = prepare_expected_terms_cache(cons, tax_xlsx)
+    ev = apply_evidence_gate(cons, em, path_term_cache)
+    with OutputWriter(str(tmp_path), fmt="csv", background=False) as writer:
+        writer.submit(cons, OUTPUT_NAMES["consolidated"], "consolidated")
+    return em, id_col, ev, path_term_cache, model, tax_xlsx, str(tmp_path)
+
+
+def _gate(rows):
+    return sorted((r["Consolidated_Path"], bool(r["Evidence_Pass"]), r["Evidence_Reason"]) for r in rows)
+
+
+def test_service_matches_run_all_on_seed_incidents(seeded):
+    from service import Classifier
+    em, id_col, ev, path_term_cache, model, tax_xlsx, seed_dir = seeded
+    clf = Classifier(model=model, taxon_xlsx=tax_xlsx, seed_dir=seed_dir)
+    # parent backoff only finds a parent run_all's cache has (no extra taxonomy paths or prefixes)
+    assert clf.path_term_cache == path_term_cache
+    # one incident at a time: parent backoff must not depend on the rest of the batch
+    for k, text in list(zip(em[id_col], em["_emars_text_"]))[:40]:
+        assert _gate(clf.classify([text])[0]) == _gate(ev[ev["Accident ID"] == k].to_dict("records"))
+
+
+def test_missing_seed_raises(seeded, tmp_path):
+    from service import Classifier
+    _, _, _, _, model, tax_xlsx, _ = seeded
+    with pytest.raises(FileNotFoundError):
+        Classifier(model=model, taxon_xlsx=tax_xlsx, seed_dir=str(tmp_path / "nowhere"))
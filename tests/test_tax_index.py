@@ -0,0 +1,44 @@
+"""HierarchicalIndex against the exhaustive search in assign_hierarchical on synthetic embeddings."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import config
+from assign import assign_hierarchical
+from tax_index import HierarchicalIndex, check_recall
+
+
+@pytest.fixture
+def synthetic():
+    rng = np.random.default_rng(7)
+    paths = [f"R{i} > G{j} > L{k}" for i in range(40) for j in range(3) for k in range(4)]
+    centers = rng.normal(size=(40, 24))
+    tax = np.repeat(centers, 12, axis=0) + 0.4 * rng.normal(size=(len(paths), 24))
+    em_emb = centers[rng.integers(0, 40, size=150)] + 0.6 * rng.normal(size=(150, 24))
+    em = pd.DataFrame({"Accident ID": np.arange(150), "_emars_text_": ["x"] * 150})
+    return em, paths, tax.astype(np.float32), em_emb.astype(np.float32)
+
+
+def _assign(em, paths, em_emb, tax, monkeypatch, **index_cfg):
+    monkeypatch.setattr(config, "ASSIGN_USE_INDEX", bool(index_cfg))
+    for key, value in index_cfg.items():
+        monkeypatch.setattr(config, key, value)
+    return assign_hierarchical(em, "Accident ID", paths, em_emb, tax)
+
+
+@pytest.mark.parametrize("deep", [False, True])
+def test_full_shortlist_matches_exhaustive(synthetic, monkeypatch, deep):
+    em, paths, tax, em_emb = synthetic
+    exact = _assign(em, paths, em_emb, tax, monkeypatch)
+    indexed = _assign(em, paths, em_emb, tax, monkeypatch, ASSIGN_INDEX_PARENT_SHORTLIST=40,
+                      ASSIGN_INDEX_DEEP=deep, ASSIGN_INDEX_GROUP_SHORTLIST=3)
+    pd.testing.assert_frame_equal(indexed, exact, check_exact=False, rtol=1e-5)
+
+
+def test_recall_against_exhaustive(synthetic):
+    _, paths, tax, em_emb = synthetic
+    index = HierarchicalIndex(paths, tax)
+    full = check_recall(index, em_emb, tax, k=5, shortlist=index.n_parents)
+    assert full["parent_recall"] == 1.0 and full["child_recall_at_k"] == 1.0
+    short = check_recall(index, em_emb, tax, k=5, shortlist=5)
+    assert short["parent_recall"] >= 0.95 and short["child_recall_at_k"] >= 0.95
@@ -0,0 +1,33 @@
+"""PathTree: splitting, O(1) prefixes and growth while vectorized lookups are in use."""
+import numpy as np
+
+from tax_tree import PathTree
+from utils import split_any
+
+
+def test_nodes_match_split_any():
+    paths = ["A > B > C", "A/B/D", " E ", "A > B", ""]
+    tree = PathTree(paths)
+    for p in paths:
+        node = tree.add(p)
+        parts = split_any(p)
+        assert tree.parts(node) == parts
+        assert tree.path(node) == " > ".join(parts)
+        assert tree.leaf(node) == (parts[-1] if parts else None)
+        assert tree.parent_path(node) == (" > ".join(parts[:-1]) if len(parts) > 1 else None)
+
+
+def test_prefix_is_ancestor_at_depth():
+    tree = PathTree()
+    node = tree.add("A > B > C > D")
+    assert [tree.path(tree.prefix(node, d)) for d in range(6)] == ["", "A", "A > B", "A > B > C", "A > B > C > D", "A > B > C > D"]
+    assert tree.prefix(-1, 2) == -1
+
+
+def test_growth_after_vectorized_lookup():
+    tree = PathTree(["A > B", "C > D"])
+    nodes = np.append(tree.ids(["A > B", "C > D"]), -1)
+    labels = tree.leaf_labels(nodes, "UNCAT")
+    tree.add("E > F > G")   # no numpy view of the node arrays may outlive a lookup
+    assert labels.tolist() == ["B", "D", "UNCAT"]
+    assert tree.root_labels(tree.ids(["E > F > G", "A > B"])).tolist() == ["E", "A"]
@@ -23,6 +23,12 @@ def norm_text(x):
     return s
 
 
+def unique_texts(texts):
+    """Collapse texts equal after norm_text: (unique texts in first-seen order, index into them per input)."""
+    codes, uniques = pd.factorize(pd.Series([norm_text(t) for t in texts], dtype=object))
+    return uniques.tolist(), codes
+
+
 def pick_tax_col(df):
     candidates = ["final_category_path", "category_path", "path", "tax_doc", "taxonomy", "label", "name"]
     for cand in candidates:
@@ -84,22 +90,39 @@ def canonical_phrase(phrase: str) -> str:
     return re.sub(r"\s+", " ", p).strip().lower()
 
 
+# Family cues in priority order: the first family with any cue in the text wins
+EQUIP_CUES = {
+    "Pump":        [r"\bpump\b", r"\bcentrifugal pump\b", r"\breciprocating pump\b", r"\brotary pump\b"],
+    "Compressor":  [r"\bcompressor\b", r"\bcentrifugal compressor\b", r"\baxial compressor\b", r"\breciprocating compressor\b"],
+    "Motor":       [r"\bmotor\b", r"\bac motor\b", r"\bdc motor\b", r"\belectric motor\b"],
+    "Gearbox":     [r"\bgear ?box\b", r"\bgearbox\b", r"\btransmission\b", r"\bdrive train\b"],
+    "Turbine":     [r"\bturbine\b", r"\bgas turbine\b", r"\bsteam turbine\b"],
+    "Fan/Blower":  [r"\bfan\b", r"\bblower\b"],
+    "Agitator":    [r"\bagitator\b", r"\bimpeller\b", r"\bmixer\b"],
+}
+_EQUIP_FAMILIES = list(EQUIP_CUES)
+# every cue is a \b-delimited phrase, so the boundaries are factored out of one alternation
+_EQUIP_PATTERN = re.compile(
+    r"\b(?:" + "|".join(f"(?P<f{i}>{'|'.join(p[2:-2] for p in pats)})" for i, pats in enumerate(EQUIP_CUES.values())) + r")\b"
+)
+
 def infer_equipment_family(text: str):
-    t = str(text).lower()
-    EQUIP_CUES = {
-        "Pump":        [r"\bpump\b", r"\bcentrifugal pump\b", r"\breciprocating pump\b", r"\brotary pump\b"],
-        "Compressor":  [r"\bcompressor\b", r"\bcentrifugal compressor\b", r"\baxial compressor\b", r"\breciprocating compressor\b"],
-        "Motor":       [r"\bmotor\b", r"\bac motor\b", r"\bdc motor\b", r"\belectric motor\b"],
-        "Gearbox":     [r"\bgear ?box\b", r"\bgearbox\b", r"\btransmission\b", r"\bdrive train\b"],
-        "Turbine":     [r"\bturbine\b", r"\bgas turbine\b", r"\bsteam turbine\b"],
-        "Fan/Blower":  [r"\bfan\b", r"\bblower\b"],
-        "Agitator":    [r"\bagitator\b", r"\bimpeller\b", r"\bmixer\b"],
-    }
-    for fam, pats in EQUIP_CUES.items():
-        for pat in pats:
-            if re.search(pat, t):
-                return fam
-    return None
+    best = None
+    for m in _EQUIP_PATTERN.finditer(str(text).lower()):
+        rank = int(m.lastgroup[1:])
+        if best is None or rank < best:
+            best = rank
+            if best == 0:
+                break
+    return _EQUIP_FAMILIES[best] if best is not None else None
+
+
+def infer_equipment_families(texts) -> pd.Series:
+    """infer_equipment_family over a Series of texts; each distinct text is scanned once."""
+    texts = pd.Series(texts)
+    codes, uniques = pd.factorize(texts.astype(str), use_na_sentinel=False)
+    fams = pd.Series([infer_equipment_family(t) for t in uniques], dtype=object)
+    return pd.Series(fams.to_numpy()[codes], index=texts.index, dtype=object)
 
 
 def _clean_desc_text(s: str) -> str:
@@ -0,0 +1,100 @@
+"""
+Background output writer: DataFrames are queued to a worker thread and serialized as CSV,
+gzip-compressed CSV or zstd Parquet while the pipeline moves on to the next stage.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import config
+
+OUTPUT_FORMATS = {"csv": ".csv", "csv.gz": ".csv.gz", "parquet": ".parquet"}
+
+# base file name of each stage output (the format's extension is appended)
+OUTPUT_NAMES = {
+    "raw": "eMARS_taxonomy_assignment_raw",
+    "consolidated": "eMARS_assignment_consolidated",
+    "evidence": "output_evidence_locked",
+    "rendered": "eMARS_assignment_with_render",
+}
+
+
+def _snapshot(df):
+    # with copy-on-write (pandas >= 3) a shallow copy is unaffected by later in-place edits of df
+    cow = pd.get_option("mode.copy_on_write") if int(pd.__version__.split(".")[0]) < 3 else True
+    return df.copy(deep=not cow)
+
+
+def write_frame(df, base_path, fmt=None, compression_level=None):
+    """Write df to base_path + the format's extension (atomically) and return the final path."""
+    fmt = fmt or config.OUTPUT_FORMAT
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"output format must be one of {sorted(OUTPUT_FORMATS)}, got {fmt!r}")
+    level = config.OUTPUT_COMPRESSION_LEVEL if compression_level is None else compression_level
+    path = base_path + OUTPUT_FORMATS[fmt]
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp, index=False, compression="zstd", compression_level=level)
+    elif fmt == "csv.gz":
+        df.to_csv(tmp, index=False, compression={"method": "gzip", "compresslevel": level if level is not None else 6})
+    else:
+        df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def read_frame(base_path, fmt=None):
+    """Read back a frame written by write_frame, trying `fmt` (default OUTPUT_FORMAT) before the other formats."""
+    fmt = fmt or config.OUTPUT_FORMAT
+    for f in [fmt] + [f for f in OUTPUT_FORMATS if f != fmt]:
+        path = base_path + OUTPUT_FORMATS.get(f, "")
+        if os.path.exists(path):
+            return pd.read_parquet(path) if f == "parquet" else pd.read_csv(path, float_precision="round_trip")
+    raise FileNotFoundError(f"no {base_path}{{{','.join(OUTPUT_FORMATS.values())}}}")
+
+
+class OutputWriter:
+    """Queue frames with submit(); close() waits for every write and re-raises the first failure."""
+
+    def __init__(self, save_dir, fmt=None, background=None):
+        self.save_dir = save_dir
+        self.fmt = fmt or config.OUTPUT_FORMAT
+        background = config.OUTPUT_BACKGROUND if background is None else background
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="output-writer") if background else None
+        self._pending = []
+
+    def _write(self, df, name, label):
+        path = write_frame(df, os.path.join(self.save_dir, name), self.fmt)
+        if label:
+            print(f"Saved {label}: {path}")
+        return path
+
+    def submit(self, df, name, label=None):
+        if self._pool is None:
+            self._pending.append(self._write(df, name, label))
+        else:
+            self._pending.append(self._pool.submit(self._write, _snapshot(df), name, label))
+
+    def close(self):
+        """Block until all queued frames are on disk; returns their paths in submission order."""
+        paths, error = [], None
+        for p in self._pending:
+            if isinstance(p, str):
+                paths.append(p)
+                continue
+            try:
+                paths.append(p.result())
+            except Exception as e:
+                error = error or e
+        self._pending = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if error is not None:
+            raise error
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()